@@ -1,6 +1,8 @@
 from flask import Flask, request, render_template, jsonify, send_from_directory
 import os
+import argparse
 from main import analyse_audio
+from src.models import preload
 
 app = Flask(__name__)
 
@@ -49,5 +51,11 @@ def upload():
     return jsonify({'error': 'Invalid file format'})
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--preload', action='store_true', help='Load every model at startup instead of on the first request')
+    args = parser.parse_args()
+    # with debug=True the reloader runs this script twice, and only the child (WERKZEUG_RUN_MAIN) serves requests
+    if args.preload and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        preload()
     app.run(debug=True)
 
@@ -1,23 +1,42 @@
 
-from src.fake.predict import analyze_audio
+from src.fake.predict import analyze_audio, STREAMING_MIN_SECONDS
 from src.impersonator.predict import analyse_is_impersonator
-from src.message_func import process_transcript, find_single_closest_match, load_client_profiles
+from src.message_func import process_transcript, find_single_closest_match
 from src.wrong_info.fact_check import run_fact_check
+from src.models import preload
+from src.audio import AudioClip, LOG_MEL_SECONDS
+from src.client_profiles import get_profile_store
 
 import os
+import argparse
 import numpy as np
-import pandas as pd
-
-#reload automatically the modules
-import importlib
-import sys
+import soundfile as sf
 
 client_profiles_path = '../client_profiles/client_features.csv'
 
+def load_clip(audio_path):
+	# the inputs of the fake detector and of the impersonator check. A missing, non-wav or undecodable upload stays a
+	# path, so analyze_audio reports it through its own error path
+	if not os.path.exists(audio_path) or not audio_path.lower().endswith(".wav"):
+		return audio_path, audio_path
+	try:
+		if sf.info(audio_path).duration > STREAMING_MIN_SECONDS:
+			# a long recording is never decoded whole: the fake detector streams it from disk and the impersonator
+			# check only looks at its start
+			return audio_path, AudioClip.load(audio_path, duration=LOG_MEL_SECONDS)
+		clip = AudioClip.load(audio_path)
+		return clip, clip
+	except Exception as e:
+		print(f"Error loading audio file {audio_path}: {e}")
+		return audio_path, audio_path
+
 def analyse_audio(audio_path):
+	# decode once, both detectors share the buffer and its cached views
+	fake_input, impersonator_input = load_clip(audio_path)
+
 	# CHECK IS_FAKE AUDIO#
 	# print(audio_path)
-	is_fake = analyze_audio(audio_path)
+	is_fake = analyze_audio(fake_input)
 	# is_fake = "True" if is_fake else "False"
 	print(f"Is the audio fake? {is_fake}\n")
 
@@ -26,18 +45,16 @@ def analyse_audio(audio_path):
 	# print(id_audio)
 	audio_json = id_audio + ".json"
 	audio_json_path = os.path.join("../audio_clips", audio_json)
-	client_profiles = load_client_profiles(client_profiles_path)
+	profile_store = get_profile_store(client_profiles_path)
  
-	name = process_transcript(audio_json, client_profiles)
-	df_profiles = pd.read_csv(client_profiles_path)
-	names = df_profiles['name'].tolist()
-	name_filtered = find_single_closest_match(name, names)
+	name = process_transcript(audio_json, profile_store.profiles)
+	name_filtered = find_single_closest_match(name, profile_store.names)
 	# name_filtered = "Jorge Castillo"
 	# print(f"Name: {name_filtered}\n")
 
 	is_wrong = run_fact_check(client_profiles_path, id_audio)
 
-	is_impersonator = analyse_is_impersonator(audio_path, name_filtered)
+	is_impersonator = analyse_is_impersonator(impersonator_input, name_filtered)
 	# is_impersonator = "True" if is_impersonator else "False"
 	print(f"Is the audio impersonator? {is_impersonator}\n")
  
@@ -45,10 +62,13 @@ def analyse_audio(audio_path):
 	return is_fake, is_wrong, is_impersonator, name_filtered
 
 if __name__ == "__main__":
-	if len(sys.argv) < 2:
-		print("Please provide the path to the audio file as an argument.")
-		sys.exit(1)
-	audio_path = sys.argv[1]
+	parser = argparse.ArgumentParser()
+	parser.add_argument("audio_path", type=str, help="Path to the audio file to analyse")
+	parser.add_argument("--preload", action="store_true", help="Load every model up front instead of on first use")
+	args = parser.parse_args()
+	if args.preload:
+		preload()
+	audio_path = args.audio_path
 	is_fake, _, is_impersonator, name_filtered = analyse_audio(audio_path)
 	print(is_fake, is_impersonator, name_filtered)
 	# Do something with the results
\ No newline at end of file
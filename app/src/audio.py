@@ -0,0 +1,60 @@
+import numpy as np
+
+# librosa is imported where it is used, it takes longer to import than the whole app needs to start
+
+# whisper.pad_or_trim keeps this much of a recording, the rest never reaches log_mel
+LOG_MEL_SECONDS = 30
+
+
+class AudioClip:
+	# decoded once at the native sample rate, derived views are computed on first use and cached
+
+	def __init__(self, samples, sr, path=None):
+		self.samples = np.asarray(samples, dtype=np.float32)
+		self.sr = sr
+		self.path = path
+		self._views = {}
+
+	@classmethod
+	def load(cls, path, duration=None):
+		# duration in seconds decodes only the start of the file
+		import librosa
+		samples, sr = librosa.load(path, sr=None, duration=duration)
+		return cls(samples, sr, path=path)
+
+	@property
+	def duration(self):
+		return self.samples.shape[0] / self.sr
+
+	def _cached(self, key, compute):
+		if key not in self._views:
+			self._views[key] = compute()
+		return self._views[key]
+
+	def resampled(self, target_sr=16_000):
+		if target_sr == self.sr:
+			return self.samples
+		import librosa
+		return self._cached(('resampled', target_sr),
+			lambda: librosa.resample(self.samples, orig_sr=self.sr, target_sr=target_sr))
+
+	def mfcc(self, n_mfcc=200, n_fft=2048, hop_length=512):
+		import librosa
+		return self._cached(('mfcc', n_mfcc, n_fft, hop_length),
+			lambda: librosa.feature.mfcc(y=self.samples, sr=self.sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length))
+
+	def log_mel(self, target_sr=16_000):
+		# whisper input: peak-normalised 16 kHz audio padded or trimmed to 30 s, plus the share that is real audio
+		def compute():
+			import whisper
+			y = self.resampled(target_sr)
+			y = y / np.max(np.abs(y))
+			valid_share = y.shape[0]
+			y = whisper.pad_or_trim(y)
+			valid_share /= y.shape[0]
+			return whisper.log_mel_spectrogram(y), valid_share
+		return self._cached(('log_mel', target_sr), compute)
+
+
+def as_clip(audio):
+	return audio if isinstance(audio, AudioClip) else AudioClip.load(audio)
@@ -0,0 +1,163 @@
+import os
+import csv
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+import jellyfish
+
+
+def normalize_name(name):
+	name = name.lower()
+	name = ''.join(c for c in unicodedata.normalize('NFD', name) if unicodedata.category(c) != 'Mn')
+	name = name.replace('-', ' ').replace("'", '')
+	return ' '.join(name.split())
+
+
+def exact_name(name):
+	return name.lower().strip()
+
+
+def normalize_account(account_nr):
+	return ''.join(c for c in account_nr.upper() if c.isalnum())
+
+
+def prepare_name(name):
+	# what name scoring needs from one side of a comparison: normalized form, its parts and its soundex code
+	normalized = normalize_name(name)
+	return normalized, set(normalized.split()), jellyfish.soundex(normalized)
+
+
+def trigrams(normalized):
+	padded = f"  {normalized} "
+	return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+	# candidate generation for fuzzy name lookups: a character trigram inverted index plus a soundex key per name part.
+	# A lookup scores only the names sharing the most trigrams, and those sounding like one of its parts, instead of all
+	def __init__(self, names, max_candidates=64):
+		self.names = names
+		self.max_candidates = max_candidates
+		self.prepared = [prepare_name(name) for name in names]
+		self.grams = defaultdict(list)
+		self.phonetic = defaultdict(list)
+		for i, (normalized, parts, _) in enumerate(self.prepared):
+			for gram in trigrams(normalized):
+				self.grams[gram].append(i)
+			for part in parts:
+				self.phonetic[jellyfish.soundex(part)].append(i)
+		# trigrams shared by this many names say little about a match and cost the most to count
+		self.max_postings = max(256, len(names) // 500)
+
+	def candidates(self, name):
+		if len(self.names) <= self.max_candidates:
+			return list(range(len(self.names)))
+		normalized = normalize_name(name)
+		postings = sorted((self.grams[gram] for gram in trigrams(normalized) if gram in self.grams), key=len)
+		selective = [posting for posting in postings if len(posting) <= self.max_postings] or postings[:3]
+		counts = Counter()
+		for posting in selective:
+			counts.update(posting)
+		found = [i for i, _ in counts.most_common(self.max_candidates)]
+
+		# a few names per sound cover spellings the trigrams miss, without scoring every common surname
+		seen = set(found)
+		for part in normalized.split():
+			for i in self.phonetic.get(jellyfish.soundex(part), ())[:self.max_candidates // 4]:
+				if i not in seen:
+					seen.add(i)
+					found.append(i)
+		return sorted(found)
+
+
+_indexes = []
+_indexes_lock = threading.Lock()
+
+
+def name_index(items, key=None, cache_size=4):
+	# indexes are cached by the names they hold, copied into a tuple, so a list changed in place gets a new index.
+	# A tuple, like the snapshots of a profile store hand out, cannot change and is also found by identity
+	with _indexes_lock:
+		for cached_items, cached_key, index in _indexes:
+			if cached_items is items and cached_key is key:
+				return index
+	names = tuple(key(item) for item in items) if key else tuple(items)
+	with _indexes_lock:
+		for _, _, index in _indexes:
+			if index.names == names:
+				return index
+	index = NameIndex(names)
+	with _indexes_lock:
+		_indexes.insert(0, (items if isinstance(items, tuple) else None, key, index))
+		del _indexes[cache_size:]
+	return index
+
+
+class ProfileSnapshot:
+	# one parse of the client book; never mutated, so threads and forked workers can read it without locks
+	def __init__(self, profiles, mtime):
+		self.profiles = tuple(profiles)
+		self.names = tuple(profile['name'] for profile in profiles)
+		self.mtime = mtime
+		self.by_name = {}
+		self.by_account = {}
+		for profile in profiles:
+			# first row wins, and names compare like the linear scans this replaces: case and outer blanks only.
+			# Accents, hyphens and apostrophes still count, fuzzy lookups go through name_index
+			self.by_name.setdefault(exact_name(profile['name']), profile)
+			if profile.get('account_nr'):
+				self.by_account.setdefault(normalize_account(profile['account_nr']), profile)
+
+
+class ClientProfileStore:
+	# the client book parsed once, indexed by name and normalized account number, and parsed again when the file changes.
+	# Rows are shared between callers and must be treated as read-only
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.snapshot = None
+
+	def _load(self, mtime):
+		with open(self.path, 'r', newline='', encoding='utf-8') as csvfile:
+			return ProfileSnapshot(list(csv.DictReader(csvfile)), mtime)
+
+	def current(self):
+		# one stat per lookup; a reload swaps the whole snapshot, so readers never see half an update
+		mtime = os.stat(self.path).st_mtime_ns
+		snapshot = self.snapshot
+		if snapshot is None or snapshot.mtime != mtime:
+			with self.lock:
+				if self.snapshot is None or self.snapshot.mtime != mtime:
+					self.snapshot = self._load(mtime)
+				snapshot = self.snapshot
+		return snapshot
+
+	@property
+	def profiles(self):
+		return self.current().profiles
+
+	@property
+	def names(self):
+		return self.current().names
+
+	def by_name(self, name):
+		return self.current().by_name.get(exact_name(name))
+
+	def by_account(self, account_nr):
+		return self.current().by_account.get(normalize_account(account_nr))
+
+	def __len__(self):
+		return len(self.current().profiles)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_profile_store(path):
+	path = os.path.abspath(path)
+	with _stores_lock:
+		if path not in _stores:
+			_stores[path] = ClientProfileStore(path)
+		return _stores[path]
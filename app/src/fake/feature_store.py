@@ -0,0 +1,61 @@
+import os
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+def file_hash(path, block_size=1 << 20):
+	digest = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(block_size), b''):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+class FeatureStore:
+	# features keyed by the sha1 of the audio file content, so renamed or moved clips are not re-extracted
+	# and edited clips are. params identify the extractor settings; a mismatch invalidates the whole store
+
+	def __init__(self, path, params):
+		self.path = path
+		self.params = dict(params)
+		self.features = {}
+		self.load()
+
+	def _params_key(self):
+		return repr(sorted(self.params.items()))
+
+	def load(self):
+		if not os.path.exists(self.path):
+			return
+		with np.load(self.path, allow_pickle=False) as data:
+			if str(data['params']) != self._params_key():
+				print(f"Feature store {self.path} was built with other parameters, starting over")
+				return
+			self.features = dict(zip(data['hashes'].tolist(), data['features']))
+
+	def save(self):
+		os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+		hashes = sorted(self.features)
+		features = np.stack([self.features[h] for h in hashes]) if hashes else np.empty((0, 0))
+		tmp_path = self.path + '.tmp.npz'
+		np.savez(tmp_path, params=np.array(self._params_key()), hashes=np.array(hashes, dtype=str), features=features)
+		os.replace(tmp_path, self.path)
+
+	def get_features(self, audio_paths, extract, workers=None, chunksize=4):
+		# returns one feature vector (or None when extraction failed) per path, extracting only unseen content
+		hashes = [file_hash(path) for path in audio_paths]
+		missing = {}
+		for path, h in zip(audio_paths, hashes):
+			if h not in self.features and h not in missing:
+				missing[h] = path
+
+		if missing:
+			print(f"Extracting features for {len(missing)} new or changed files, {len(audio_paths) - len(missing)} cached")
+			with ProcessPoolExecutor(max_workers=workers) as executor:
+				for h, features in zip(missing, executor.map(extract, missing.values(), chunksize=chunksize)):
+					if features is not None:
+						self.features[h] = features
+			self.save()
+
+		return [self.features.get(h) for h in hashes]
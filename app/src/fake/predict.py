@@ -1,23 +1,30 @@
 import os
 import glob
-import librosa
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.svm import SVC
-from sklearn.metrics import accuracy_score, confusion_matrix
-import joblib
+import soundfile as sf
+import time
 import argparse
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from src.models import get_fake_model
+from src.audio import AudioClip, as_clip
 
-def extract_mfcc_features(audio_path, n_mfcc=200, n_fft=2048, hop_length=512):
+# librosa and sklearn are imported by the functions that use them, so importing the detector stays cheap
+
+# recordings longer than this are streamed from disk instead of decoded whole
+STREAMING_MIN_SECONDS = 120
+
+def extract_mfcc_features(audio, n_mfcc=200, n_fft=2048, hop_length=512):
+	# audio is a path or an already decoded AudioClip
 	try:
-		audio_data, sr = librosa.load(audio_path, sr=None)
+		if not isinstance(audio, AudioClip) and sf.info(audio).duration > STREAMING_MIN_SECONDS:
+			from src.fake.streaming_mfcc import extract_mfcc_features_streaming
+			return extract_mfcc_features_streaming(audio, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
+		clip = as_clip(audio)
 	except Exception as e:
-		print(f"Error loading audio file {audio_path}: {e}")
+		print(f"Error loading audio file {audio}: {e}")
 		return None
 
-	mfccs = librosa.feature.mfcc(y=audio_data, sr=sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
+	mfccs = clip.mfcc(n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
 	return np.mean(mfccs.T, axis=0)
 
 def create_dataset(directory, label):
@@ -37,6 +44,12 @@ def create_dataset(directory, label):
 
 
 def train_model(X, y):
+	import joblib
+	from sklearn.model_selection import train_test_split
+	from sklearn.preprocessing import StandardScaler
+	from sklearn.svm import SVC
+	from sklearn.metrics import accuracy_score, confusion_matrix
+
 	unique_classes = np.unique(y)
 	print("Unique classes in y_train:", unique_classes)
 
@@ -89,24 +102,79 @@ def train_model(X, y):
 	joblib.dump(svm_classifier, "src/fake/model/" + model_filename)
 	joblib.dump(scaler, "src/fake/model/" + scaler_filename)
 
-def analyze_audio(input_audio_path):
-	model_filename = "svm_model.pkl"
-	scaler_filename = "scaler.pkl"
-	svm_classifier = joblib.load("src/fake/model/" + model_filename)
-	scaler = joblib.load("src/fake/model/" + scaler_filename)
-
-	if not os.path.exists(input_audio_path):
-		print("Error: The specified file does not exist.")
-		return
-	elif not input_audio_path.lower().endswith(".wav"):
-		print("Error: The specified file is not a .wav file.")
-		return
-
-	mfcc_features = extract_mfcc_features(input_audio_path)
+class FakeDetector:
+	def __init__(self, svm_classifier=None, scaler=None):
+		if svm_classifier is None or scaler is None:
+			svm_classifier, scaler = get_fake_model()
+		self.svm_classifier = svm_classifier
+		self.scaler = scaler
+
+	def predict_proba(self, features):
+		# features is one MFCC vector or a stacked (n_clips, n_mfcc) matrix
+		features = np.atleast_2d(features)
+		return self.svm_classifier.predict_proba(self.scaler.transform(features))
+
+	def predict_features(self, features):
+		prediction = self.predict_proba(features)
+		return np.where(prediction[:, 0] > prediction[:, 1], 0, 1)
+
+	def predict(self, audio):
+		return self.predict_many([audio])[0]
+
+	def predict_many(self, audios):
+		# audios are paths or AudioClips; clips that fail to load are reported as None,
+		# the rest go through one transform and predict_proba
+		features = [extract_mfcc_features(audio) for audio in audios]
+		valid = [i for i, mfcc_features in enumerate(features) if mfcc_features is not None]
+		results = [None] * len(audios)
+		if valid:
+			labels = self.predict_features(np.vstack([features[i] for i in valid]))
+			for i, label in zip(valid, labels):
+				results[i] = int(label)
+		return results
+
+def extract_features_parallel(audio_paths, workers=None, chunksize=8, report_every=50):
+	# rows of clips that fail to load stay NaN and are flagged in the valid mask. The width comes from the
+	# extracted vectors: librosa caps n_mfcc at n_mels, so it is not always the requested n_mfcc
+	rows = [None] * len(audio_paths)
+	start = time.perf_counter()
+
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		for i, mfcc_features in enumerate(executor.map(extract_mfcc_features, audio_paths, chunksize=chunksize)):
+			rows[i] = mfcc_features
+			if (i + 1) % report_every == 0 or i + 1 == len(audio_paths):
+				elapsed = time.perf_counter() - start
+				print(f"Extracted {i + 1}/{len(audio_paths)} clips ({(i + 1) / elapsed:.1f} clips/s)")
+
+	valid = np.array([mfcc_features is not None for mfcc_features in rows], dtype=bool)
+	width = next((len(mfcc_features) for mfcc_features in rows if mfcc_features is not None), 0)
+	features = np.full((len(audio_paths), width), np.nan)
+	for i in np.flatnonzero(valid):
+		features[i] = rows[i]
+	return features, valid
+
+def batch_predict(audio_paths, workers=None, chunksize=8):
+	features, valid = extract_features_parallel(audio_paths, workers=workers, chunksize=chunksize)
+	results = np.full(len(audio_paths), None, dtype=object)
+	if valid.any():
+		results[valid] = FakeDetector().predict_features(features[valid])
+	return results
+
+def analyze_audio(audio):
+	detector = FakeDetector()
+
+	if not isinstance(audio, AudioClip):
+		if not os.path.exists(audio):
+			print("Error: The specified file does not exist.")
+			return
+		elif not audio.lower().endswith(".wav"):
+			print("Error: The specified file is not a .wav file.")
+			return
+
+	mfcc_features = extract_mfcc_features(audio)
 
 	if mfcc_features is not None:
-		mfcc_features_scaled = scaler.transform(mfcc_features.reshape(1, -1))
-		prediction = svm_classifier.predict_proba(mfcc_features_scaled)
+		prediction = detector.predict_proba(mfcc_features)
 		print("Prediction probabilities:", prediction)
 		if prediction[0][0] > prediction[0][1]:
 			print("Prediction: Genuine audio")
@@ -136,20 +204,22 @@ def main():
 	train_model(X, y)
 
 if __name__ == "__main__":
+	import pandas as pd
+
 	parser = argparse.ArgumentParser()
-	parser.add_argument("input_path", type=str, help="Path to the input audio file")
+	parser.add_argument("input_path", type=str, help="Path to the directory of audio files")
+	parser.add_argument("--workers", type=int, default=None, help="Number of extraction processes (default: all cores)")
+	parser.add_argument("--chunksize", type=int, default=8, help="Number of clips sent to a worker at a time")
+	parser.add_argument("--output", type=str, default="src/fake/results_final.csv", help="Path of the results CSV")
 	args = parser.parse_args()
 	input_audio_path = args.input_path
 
-	df_results = ""
-	df_results = pd.DataFrame(columns=['rec_id', 'is_fake'])
-
-	for file in os.listdir(input_audio_path):
-		if file.endswith(".wav"):
-			file_path = os.path.join(input_audio_path, file)
-			is_fake = analyze_audio(file_path)
-			rec_id = os.path.splitext(file)[0]
-			df_results = df_results._append({'rec_id': rec_id, 'is_fake': is_fake}, ignore_index=True)
+	files = sorted(file for file in os.listdir(input_audio_path) if file.endswith(".wav"))
+	start = time.perf_counter()
+	is_fake = batch_predict([os.path.join(input_audio_path, file) for file in files], workers=args.workers, chunksize=args.chunksize)
+	elapsed = time.perf_counter() - start
+	print(f"Scored {len(files)} clips in {elapsed:.1f}s ({len(files) / max(elapsed, 1e-9):.1f} clips/s)")
 
 	#save the results
-	df_results.to_csv("src/fake/results_final.csv", index=False)
+	df_results = pd.DataFrame({'rec_id': [os.path.splitext(file)[0] for file in files], 'is_fake': is_fake})
+	df_results.to_csv(args.output, index=False)
@@ -0,0 +1,15 @@
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+class MfccSelector(BaseEstimator, TransformerMixin):
+	# keeps the leading n_mfcc coefficients; librosa's orthonormal DCT makes these equal to a smaller n_mfcc extraction.
+	# Lives apart from predict.py so importing the detector does not import sklearn; the pickled scaler loads it from here
+	def __init__(self, n_mfcc=200):
+		self.n_mfcc = n_mfcc
+
+	def fit(self, X, y=None):
+		return self
+
+	def transform(self, X):
+		return np.asarray(X)[:, :self.n_mfcc]
@@ -0,0 +1,76 @@
+import numpy as np
+import librosa
+import soundfile as sf
+
+
+class RunningStats:
+	# per-coefficient mean and variance over frames, merged block by block (Chan et al.)
+	def __init__(self, n_features):
+		self.count = 0
+		self.mean = np.zeros(n_features)
+		self.m2 = np.zeros(n_features)
+
+	def update(self, frames):
+		# frames has shape (n_features, n_frames), as returned by librosa
+		n = frames.shape[1]
+		if n == 0:
+			return
+		block_mean = frames.mean(axis=1)
+		block_m2 = ((frames - block_mean[:, None]) ** 2).sum(axis=1)
+		total = self.count + n
+		delta = block_mean - self.mean
+		self.mean += delta * n / total
+		self.m2 += block_m2 + delta ** 2 * self.count * n / total
+		self.count = total
+
+	@property
+	def variance(self):
+		return self.m2 / self.count if self.count else np.full_like(self.m2, np.nan)
+
+
+def _stream_frames(audio_path, n_fft, hop_length, block_size):
+	# yields the same frames librosa.stft(center=True, pad_mode='constant') would see,
+	# holding at most block_size + n_fft samples at a time
+	buffer = np.zeros(n_fft // 2, dtype=np.float32)
+	blocks = sf.blocks(audio_path, blocksize=block_size, dtype='float32', always_2d=True)
+	for block in (b.mean(axis=1) for b in blocks):
+		buffer = np.concatenate([buffer, block])
+		if buffer.shape[0] >= n_fft:
+			n_frames = 1 + (buffer.shape[0] - n_fft) // hop_length
+			yield buffer[:(n_frames - 1) * hop_length + n_fft]
+			buffer = buffer[n_frames * hop_length:]
+	buffer = np.concatenate([buffer, np.zeros(n_fft // 2, dtype=np.float32)])
+	if buffer.shape[0] >= n_fft:
+		yield buffer
+
+
+def _mel_power(segment, sr, n_fft, hop_length):
+	stft = librosa.stft(segment, n_fft=n_fft, hop_length=hop_length, center=False)
+	return librosa.feature.melspectrogram(S=np.abs(stft) ** 2, sr=sr, n_fft=n_fft)
+
+
+def extract_mfcc_stats_streaming(audio_path, n_mfcc=200, n_fft=2048, hop_length=512, block_size=1 << 16, top_db=80.0, amin=1e-10):
+	sr = sf.info(audio_path).samplerate
+
+	# librosa clips the log-mel spectrogram at top_db below its global peak, so a first pass finds the peak
+	peak = amin
+	for segment in _stream_frames(audio_path, n_fft, hop_length, block_size):
+		peak = max(peak, float(_mel_power(segment, sr, n_fft, hop_length).max()))
+	floor_db = 10.0 * np.log10(peak) - top_db
+
+	stats = None
+	for segment in _stream_frames(audio_path, n_fft, hop_length, block_size):
+		log_mel = np.maximum(10.0 * np.log10(np.maximum(amin, _mel_power(segment, sr, n_fft, hop_length))), floor_db)
+		mfccs = librosa.feature.mfcc(S=log_mel, n_mfcc=n_mfcc)
+		if stats is None:
+			stats = RunningStats(mfccs.shape[0])
+		stats.update(mfccs)
+
+	if stats is None:
+		raise ValueError(f"{audio_path} is shorter than one analysis frame")
+	return stats.mean, stats.variance
+
+
+def extract_mfcc_features_streaming(audio_path, n_mfcc=200, n_fft=2048, hop_length=512, block_size=1 << 16):
+	mean, _ = extract_mfcc_stats_streaming(audio_path, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length, block_size=block_size)
+	return mean
@@ -2,13 +2,24 @@ import os
 import glob
 import librosa
 import numpy as np
-from sklearn.model_selection import train_test_split
+import json
+import time
+from datetime import datetime
+from sklearn.model_selection import train_test_split, StratifiedKFold, GridSearchCV
+from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 from sklearn.svm import SVC
 #log reg
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, confusion_matrix
 import joblib
+import argparse
+import functools
+from src.fake.feature_store import FeatureStore
+from src.fake.selector import MfccSelector
+
+MFCC_PARAMS = {'n_mfcc': 200, 'n_fft': 2048, 'hop_length': 512}
+FEATURE_STORE_PATH = "src/fake/features/mfcc_features.npz"
 
 def extract_mfcc_features(audio_path, n_mfcc=200, n_fft=2048, hop_length=512):
 	try:
@@ -20,11 +31,16 @@ def extract_mfcc_features(audio_path, n_mfcc=200, n_fft=2048, hop_length=512):
 	mfccs = librosa.feature.mfcc(y=audio_data, sr=sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
 	return np.mean(mfccs.T, axis=0)
 
-def create_dataset(directory, label):
+def create_dataset(directory, label, store=None, workers=None):
 	X, y = [], []
-	audio_files = glob.glob(os.path.join(directory, "*.wav"))
-	for audio_path in audio_files:
-		mfcc_features = extract_mfcc_features(audio_path)
+	audio_files = sorted(glob.glob(os.path.join(directory, "*.wav")))
+	extract = functools.partial(extract_mfcc_features, **MFCC_PARAMS)
+	if store is not None:
+		features = store.get_features(audio_files, extract, workers=workers)
+	else:
+		features = [extract(audio_path) for audio_path in audio_files]
+
+	for audio_path, mfcc_features in zip(audio_files, features):
 		if mfcc_features is not None:
 			X.append(mfcc_features)
 			y.append(label)
@@ -36,7 +52,47 @@ def create_dataset(directory, label):
 	return X, y
 
 
-def train_model(X, y):
+DEFAULT_PARAM_GRID = {
+	'svm__kernel': ['linear', 'rbf'],
+	'svm__C': [0.1, 1, 10],
+	# librosa caps the coefficients at n_mels=128, so 128 keeps all of them
+	'select__n_mfcc': [20, 40, 80, 128],
+}
+
+def build_pipeline(probability=True):
+	# the shipped model needs probability=True because FakeDetector decides with predict_proba. libsvm fits it with an
+	# internal 5-fold CV, six fits instead of one, so the grid search compares configurations without it
+	return Pipeline([
+		('select', MfccSelector()),
+		('scaler', StandardScaler()),
+		('svm', SVC(random_state=50, probability=probability)),
+	])
+
+def proba_accuracy(estimator, X, y):
+	# FakeDetector's decision: genuine when P(genuine) > P(deepfake)
+	prediction = estimator.predict_proba(X)
+	return accuracy_score(y, np.where(prediction[:, 0] > prediction[:, 1], 0, 1))
+
+def build_search(param_grid=None, inner_splits=5, n_jobs=1):
+	# configurations are ranked by predict's accuracy; nothing is refit, fit_best refits the winner with probabilities
+	inner_cv = StratifiedKFold(n_splits=inner_splits, shuffle=True, random_state=0)
+	return GridSearchCV(build_pipeline(probability=False), param_grid or DEFAULT_PARAM_GRID, cv=inner_cv,
+		scoring='accuracy', refit=False, n_jobs=n_jobs)
+
+def fit_best(X, y, param_grid=None, inner_splits=5, n_jobs=1):
+	search = build_search(param_grid, inner_splits, n_jobs).fit(X, y)
+	return search, build_pipeline().set_params(**search.best_params_).fit(X, y)
+
+def run_fold(X, y, train, test, param_grid=None, inner_splits=5):
+	# one outer split: search and refit on train, score the refit model on test with FakeDetector's rule
+	start = time.perf_counter()
+	search, pipeline = fit_best(X[train], y[train], param_grid, inner_splits)
+	fit_time = time.perf_counter() - start
+	start = time.perf_counter()
+	accuracy = proba_accuracy(pipeline, X[test], y[test])
+	return accuracy, search.best_params_, fit_time, time.perf_counter() - start
+
+def train_model(X, y, param_grid=None, n_splits=20, inner_splits=5, n_jobs=-1, model_dir="src/fake/model/"):
 	unique_classes = np.unique(y)
 	print("Unique classes in y_train:", unique_classes)
 
@@ -45,49 +101,46 @@ def train_model(X, y):
 
 	print("Size of X:", X.shape)
 	print("Size of y:", y.shape)
-	
-	mean_accuracy = 0
-	for i in range(20):
-		X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.1, random_state=i, stratify=y)
-
-		print("Size of X_train:", X_train.shape)
-		print("Size of X_test:", X_test.shape)
-		print("Size of y_train:", y_train.shape)
-		print("Size of y_test:", y_test.shape)
-
-		scaler = StandardScaler()
-		X_train_scaled = scaler.fit_transform(X_train)
-
-		if X_test is not None:
-			X_test_scaled = scaler.transform(X_test)
 
-			svm_classifier = SVC(kernel='rbf', random_state=50, probability=True)
-			# svm_classifier = LogisticRegression(random_state=42, max_iter=1000)
-			for _ in range(100):
-				svm_classifier.fit(X_train_scaled, y_train)
-
-			y_pred = svm_classifier.predict(X_test_scaled)
-
-			accuracy = accuracy_score(y_test, y_pred)
-			confusion_mtx = confusion_matrix(y_test, y_pred)
-			mean_accuracy += accuracy
-
-			print("Accuracy:", accuracy)
-			print("Confusion Matrix:")
-			print(confusion_mtx)
-		else:
-			print("Insufficient samples for stratified splitting. Combine both classes into one for training.")
-			print("Train on all available data.")
-
-			svm_classifier = SVC(kernel='logistic', random_state=42)
-			svm_classifier.fit(X_train_scaled, y_train)
-	mean_accuracy /= 20
-	print("Mean Accuracy:", mean_accuracy)
-	# Save the trained SVM model and scaler src/fake/model
-	model_filename = "svm_model.pkl"
-	scaler_filename = "scaler.pkl"
-	joblib.dump(svm_classifier, "src/fake/model/" + model_filename)
-	joblib.dump(scaler, "src/fake/model/" + scaler_filename)
+	# nested CV: the grid search runs inside each of the 20 stratified 90/10 splits used before
+	# (train_test_split with random_state=i), so the held-out 10% never takes part in choosing the configuration
+	outer_cv = [train_test_split(np.arange(len(y)), test_size=0.1, random_state=i, stratify=y) for i in range(n_splits)]
+	folds = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(run_fold)(X, y, train, test, param_grid, inner_splits)
+		for train, test in outer_cv)
+	accuracies = np.array([accuracy for accuracy, _, _, _ in folds])
+	print("Mean Accuracy:", accuracies.mean())
+	for fold, (accuracy, params, fit_time, score_time) in enumerate(folds):
+		print(f"Fold {fold}: accuracy {accuracy:.3f}, chosen {params}, fit {fit_time:.2f} s, score {score_time * 1000:.1f} ms")
+
+	# the configuration that is shipped is chosen by the same search on all data
+	search, pipeline = fit_best(X, y, param_grid, inner_splits, n_jobs=n_jobs)
+	results = search.cv_results_
+	for params, mean, std, fit_time in zip(results['params'], results['mean_test_score'], results['std_test_score'], results['mean_fit_time']):
+		print(f"{params}: accuracy {mean:.3f} +/- {std:.3f}, fit {fit_time * 1000:.1f} ms/fold")
+	best_params = search.best_params_
+	print("Best parameters:", best_params)
+
+	# the scaler pickle keeps the MFCC selection so FakeDetector can use it unchanged
+	svm_classifier = pipeline.named_steps['svm']
+	scaler = Pipeline(pipeline.steps[:-1])
+	os.makedirs(model_dir, exist_ok=True)
+	joblib.dump(svm_classifier, os.path.join(model_dir, "svm_model.pkl"))
+	joblib.dump(scaler, os.path.join(model_dir, "scaler.pkl"))
+
+	metadata = {
+		'params': best_params,
+		# nested CV estimate; the search's own best score is biased upward by the selection
+		'mean_accuracy': float(accuracies.mean()),
+		'std_accuracy': float(accuracies.std()),
+		'n_splits': n_splits,
+		'inner_splits': inner_splits,
+		'n_samples': int(len(y)),
+		'n_features': int(X.shape[1]),
+		'mfcc_params': MFCC_PARAMS,
+		'trained_at': datetime.now().isoformat(timespec='seconds'),
+	}
+	with open(os.path.join(model_dir, "svm_model.json"), 'w') as f:
+		json.dump(metadata, f, indent=2)
 
 def analyze_audio(input_audio_path):
 	model_filename = "svm_model.pkl"
@@ -114,12 +167,13 @@ def analyze_audio(input_audio_path):
 	else:
 		print("Error: Unable to process the input audio.")
 
-def main():
+def main(workers=None, use_cache=True, n_jobs=-1):
 	genuine_dir = r"real_audio"
 	deepfake_dir = r"deepfake_audio"
 
-	X_genuine, y_genuine = create_dataset(genuine_dir, label=0)
-	X_deepfake, y_deepfake = create_dataset(deepfake_dir, label=1)
+	store = FeatureStore(FEATURE_STORE_PATH, MFCC_PARAMS) if use_cache else None
+	X_genuine, y_genuine = create_dataset(genuine_dir, label=0, store=store, workers=workers)
+	X_deepfake, y_deepfake = create_dataset(deepfake_dir, label=1, store=store, workers=workers)
 
 	# Check if each class has at least two samples
 	if len(X_genuine) < 2 or len(X_deepfake) < 2:
@@ -131,10 +185,15 @@ def main():
 		X = np.vstack((X_genuine, X_deepfake))
 		y = np.hstack((y_genuine, y_deepfake))
 
-	train_model(X, y)
+	train_model(X, y, n_jobs=n_jobs)
 
 if __name__ == "__main__":
-	main()
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--workers", type=int, default=None, help="Number of feature extraction processes (default: all cores)")
+	parser.add_argument("--no-cache", action="store_true", help="Extract every file again instead of using the feature store")
+	parser.add_argument("--n-jobs", type=int, default=-1, help="Number of parallel cross-validation jobs (default: all cores)")
+	args = parser.parse_args()
+	main(workers=args.workers, use_cache=not args.no_cache, n_jobs=args.n_jobs)
 
 	# user_input_file = input("Enter the path of the .wav file to analyze: ")
 	# analyze_audio(user_input_file)
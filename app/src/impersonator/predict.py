@@ -1,70 +1,62 @@
-import pandas as pd
-import scipy.io.wavfile as wav
-from sklearn.mixture import GaussianMixture
-from python_speech_features import mfcc
-import os
 import numpy as np
-import librosa
-import torch
-import whisper
-import scipy.io.wavfile as wav
-
-
-model = whisper.load_model("tiny")
-
-PATH = r'app\\src\\impersonator\\gmms\\'
-files_in_path = os.listdir(PATH)
-names = set([file.split('_')[1] for file in files_in_path])
-gmms = {name: GaussianMixture(n_components = 3) for name in names}
-for name in names:
-	gmm_name = PATH + 'gmm_' + name
-	means = np.load(gmm_name + '_means.npy')
-	covar = np.load(gmm_name + '_covariances.npy')
-	gmms[name].precisions_cholesky_ = np.load(gmm_name + '_precisions_cholesky.npy')
-	gmms[name].weights_ = np.load(gmm_name + '_weights.npy')
-	gmms[name].means_ = means
-	gmms[name].covariances_ = covar
-
-
-@torch.no_grad()
-def extract_features(audio_path, 
+from src.audio import as_clip
+from src.models import get_whisper_model, get_speaker_bank
+
+
+def prepare_mel(audio, target_sr = 16_000):
+
+    # audio is a path or an already decoded AudioClip, whose mel is cached
+    return as_clip(audio).log_mel(target_sr)
+
+
+def extract_features(audio,
                      model,
                      target_sr = 16_000):
-	
+
+    return extract_features_batch([audio], model, target_sr)[0]
+
+
+def extract_features_batch(audios,
+                           model,
+                           target_sr = 16_000,
+                           batch_size = 8):
+
+    # torch is imported here rather than at the top, so importing the detector does not load it
+    import torch
+
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    y, sr = librosa.load(audio_path, sr=None)
-    if sr != target_sr:
-        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
-
-    y = y / np.max(np.abs(y))
-    valid_share = y.shape[0]
-
-    y = whisper.pad_or_trim(y)
-    valid_share /= y.shape[0]
-    mel = whisper.log_mel_spectrogram(y)
-    mel = mel.unsqueeze(0).to(device)
-    features = model.embed_audio(mel)
-    
-    return features[0, :int(valid_share * 1500) + 1:10, :].cpu()
+    features = []
+
+    # the whisper encoder takes a fixed 30s window, so clips stack into one batch
+    with torch.no_grad():
+        for start in range(0, len(audios), batch_size):
+            mels, valid_shares = zip(*[prepare_mel(audio, target_sr) for audio in audios[start:start + batch_size]])
+            embeddings = model.embed_audio(torch.stack(mels).to(device))
+            for embedding, valid_share in zip(embeddings, valid_shares):
+                features.append(embedding[:int(valid_share * 1500) + 1:10, :].cpu())
+
+    return features
+
+
+def get_likelihoods(audio, bank, model):
+
+    features = extract_features(audio, model)
 
+    return bank.likelihoods(features)
 
-def get_likelihoods(audio_path, gmms, model):
 
-    likelihoods = {name: None for name in gmms.keys()}
+def get_likelihoods_batch(audios, bank, model, batch_size = 8):
 
-    for name, gmm in gmms.items():
-        features = extract_features(audio_path, model)
-        likelihoods[name] = gmm.score(features)
+    features = extract_features_batch(audios, model, batch_size=batch_size)
+    scores = bank.score_batch(features)
 
-    return likelihoods
+    return [dict(zip(bank.names.tolist(), clip_scores.tolist())) for clip_scores in scores]
 
 
-def analyze(audio_path, gmms, claimed_name, model):
+def analyze(audio, bank, claimed_name, model):
     
-        likelihoods = get_likelihoods(audio_path, gmms, model)
-        
-        highest_likelihood = max(likelihoods.values())
-        best_match = [name for name, likelihood in likelihoods.items() if likelihood == highest_likelihood][0]
+        features = extract_features(audio, model)
+        best_match = bank.best_match(features)
 
         if claimed_name == best_match:
             return 0
@@ -76,6 +68,6 @@ def coucou():
 	print("coucou")
 
 
-def analyse_is_impersonator(audio_file, actual_name):
+def analyse_is_impersonator(audio, actual_name):
 
-    return analyze(audio_file, gmms, actual_name, model)
+    return analyze(audio, get_speaker_bank(), actual_name, get_whisper_model())
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+class SpeakerBank:
+
+    def __init__(self, names, means, precisions_cholesky, weights, chunk_size = 256,
+                 log_norm = None, projected_means = None):
+        # means (S, K, D), precisions_cholesky (S, K, D, D), weights (S, K) for S speakers of K full-covariance components
+        self.names = np.asarray(names)
+        self.means = np.ascontiguousarray(means, dtype=np.float64)
+        self.precisions_cholesky = np.ascontiguousarray(precisions_cholesky, dtype=np.float64)
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)
+        self.chunk_size = chunk_size
+
+        # the derived terms can be passed in precomputed, e.g. from a packed store
+        if log_norm is None:
+            n_features = self.means.shape[-1]
+            log_det = np.log(np.diagonal(self.precisions_cholesky, axis1=-2, axis2=-1)).sum(axis=-1)
+            log_norm = log_det + np.log(self.weights) - 0.5 * n_features * np.log(2 * np.pi)
+        if projected_means is None:
+            projected_means = np.einsum('skd,skde->ske', self.means, self.precisions_cholesky)
+        self.log_norm = np.ascontiguousarray(log_norm, dtype=np.float64)
+        self.projected_means = np.ascontiguousarray(projected_means, dtype=np.float64)
+
+    @classmethod
+    def from_gmms(cls, gmms, **kwargs):
+        names = sorted(gmms)
+        return cls(names,
+                   np.stack([gmms[name].means_ for name in names]),
+                   np.stack([gmms[name].precisions_cholesky_ for name in names]),
+                   np.stack([gmms[name].weights_ for name in names]),
+                   **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def frame_scores(self, features):
+        # per-frame log-likelihood under every speaker, shape (S, N)
+        X = np.asarray(features, dtype=np.float64)
+        scores = np.empty((len(self), X.shape[0]), dtype=np.float64)
+
+        # speakers are processed in chunks so the (S, K, N, D) projection stays bounded in memory
+        for start in range(0, len(self), self.chunk_size):
+            stop = start + self.chunk_size
+            y = np.einsum('nd,skde->skne', X, self.precisions_cholesky[start:stop])
+            y -= self.projected_means[start:stop, :, None, :]
+            log_prob = self.log_norm[start:stop, :, None] - 0.5 * np.einsum('skne,skne->skn', y, y)
+            peak = log_prob.max(axis=1, keepdims=True)
+            scores[start:stop] = peak[:, 0] + np.log(np.exp(log_prob - peak).sum(axis=1))
+
+        return scores
+
+    def score(self, features):
+        # average per-frame log-likelihood, same as GaussianMixture.score for each speaker
+        return self.frame_scores(features).mean(axis=1)
+
+    def score_batch(self, features_list):
+        # all clips go through one pass, the frame scores are then averaged per clip, shape (N clips, S)
+        lengths = np.array([len(features) for features in features_list])
+        frames = self.frame_scores(np.concatenate([np.asarray(features) for features in features_list]))
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        return (np.add.reduceat(frames, offsets, axis=1) / lengths).T
+
+    def rank(self, features):
+        scores = self.score(features)
+        order = np.argsort(scores)[::-1]
+        return self.names[order], scores[order]
+
+    def likelihoods(self, features):
+        return dict(zip(self.names.tolist(), self.score(features).tolist()))
+
+    def best_match(self, features):
+        return self.names[np.argmax(self.score(features))]
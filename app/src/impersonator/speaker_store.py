@@ -0,0 +1,103 @@
+import os
+import struct
+import argparse
+import numpy as np
+from src.impersonator.speaker_bank import SpeakerBank
+
+# packed layout: fixed header, utf-8 name index, then 64-byte aligned float64 arrays
+#   means (S, K, D), precisions_cholesky (S, K, D, D), weights (S, K), log_norm (S, K), projected_means (S, K, D)
+MAGIC = b'SPKBANK\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIIII6Q')
+ALIGNMENT = 64
+ARRAY_NAMES = ['means', 'precisions_cholesky', 'weights', 'log_norm', 'projected_means']
+PARAMETER_SUFFIXES = ['_means.npy', '_covariances.npy', '_precisions_cholesky.npy', '_weights.npy']
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _array_shapes(n_speakers, n_components, n_features):
+    return {
+        'means': (n_speakers, n_components, n_features),
+        'precisions_cholesky': (n_speakers, n_components, n_features, n_features),
+        'weights': (n_speakers, n_components),
+        'log_norm': (n_speakers, n_components),
+        'projected_means': (n_speakers, n_components, n_features),
+    }
+
+
+def list_speakers(gmm_dir):
+    # files are named gmm_<name>_<parameter>.npy and names may contain spaces or apostrophes
+    names = set()
+    for file in os.listdir(gmm_dir):
+        for suffix in PARAMETER_SUFFIXES:
+            if file.startswith('gmm_') and file.endswith(suffix):
+                names.add(file[len('gmm_'):-len(suffix)])
+    return sorted(names)
+
+
+def load_gmm_dir(gmm_dir, **kwargs):
+    names = list_speakers(gmm_dir)
+    parameters = {key: [] for key in ['means', 'precisions_cholesky', 'weights']}
+    for name in names:
+        for key in parameters:
+            parameters[key].append(np.load(os.path.join(gmm_dir, f'gmm_{name}_{key}.npy')))
+
+    return SpeakerBank(names, *[np.stack(parameters[key]) for key in ['means', 'precisions_cholesky', 'weights']], **kwargs)
+
+
+def write_packed(bank, path):
+    n_speakers, n_components, n_features = bank.means.shape
+    name_index = '\n'.join(bank.names.tolist()).encode('utf-8')
+
+    offset = _aligned(HEADER.size + len(name_index))
+    offsets = []
+    for key in ARRAY_NAMES:
+        offsets.append(offset)
+        offset = _aligned(offset + getattr(bank, key).nbytes)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, n_speakers, n_components, n_features, len(name_index), *offsets))
+        f.write(name_index)
+        for key, array_offset in zip(ARRAY_NAMES, offsets):
+            f.seek(array_offset)
+            f.write(np.ascontiguousarray(getattr(bank, key), dtype='<f8').tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+
+
+def load_packed(path, **kwargs):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        magic, version, n_speakers, n_components, n_features, names_size, *offsets = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a packed speaker bank (version {VERSION})")
+        names = f.read(names_size).decode('utf-8').split('\n') if n_speakers else []
+
+    # read-only maps share the page cache between every worker that opens the same file
+    shapes = _array_shapes(n_speakers, n_components, n_features)
+    arrays = {key: np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=shapes[key])
+              for key, offset in zip(ARRAY_NAMES, offsets)}
+
+    return SpeakerBank(names, arrays['means'], arrays['precisions_cholesky'], arrays['weights'],
+                       log_norm=arrays['log_norm'], projected_means=arrays['projected_means'], **kwargs)
+
+
+def load_speaker_bank(gmm_dir, packed_path=None, **kwargs):
+    if packed_path is not None and os.path.exists(packed_path):
+        return load_packed(packed_path, **kwargs)
+    return load_gmm_dir(gmm_dir, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the per-speaker gmm_<name>_*.npy files into one memory-mappable file")
+    parser.add_argument("gmm_dir", type=str, help="Directory with the gmm_<name>_*.npy files")
+    parser.add_argument("output_path", type=str, help="Path of the packed speaker bank to write")
+    args = parser.parse_args()
+
+    bank = load_gmm_dir(args.gmm_dir)
+    write_packed(bank, args.output_path)
+    print(f"Packed {len(bank)} speakers into {args.output_path}")
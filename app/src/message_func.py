@@ -1,33 +1,28 @@
 import os
 import json
 import csv
-import spacy
 import jellyfish
-import unicodedata
 from fuzzywuzzy import fuzz
 from collections import Counter
-from groq import Groq
-import pandas as pd
+from operator import itemgetter
+from src.models import get_nlp
+from src.client_profiles import prepare_name, name_index, get_profile_store
+from src.transcript.llm_client import get_llm_client
 
-# Load spaCy model for NER
-nlp = spacy.load("en_core_web_sm")
-
-def normalize_name(name):
-	name = name.lower()
-	name = ''.join(c for c in unicodedata.normalize('NFD', name) if unicodedata.category(c) != 'Mn')
-	name = name.replace('-', ' ').replace("'", '')
-	return ' '.join(name.split())
+PROFILE_NAME = itemgetter('name')
 
 def name_similarity(name1, name2):
-	name1 = normalize_name(name1)
-	name2 = normalize_name(name2)
-	
+	return prepared_similarity(prepare_name(name1), prepare_name(name2))
+
+def prepared_similarity(prepared1, prepared2):
+	# scores two prepare_name() results, so an indexed profile's normalized form and soundex are computed only once
+	name1, parts1, soundex1 = prepared1
+	name2, parts2, soundex2 = prepared2
+
 	jaro_winkler = jellyfish.jaro_winkler_similarity(name1, name2)
 	levenshtein = jellyfish.levenshtein_distance(name1, name2)
-	soundex_similarity = int(jellyfish.soundex(name1) == jellyfish.soundex(name2))
-	
-	parts1 = set(name1.split())
-	parts2 = set(name2.split())
+	soundex_similarity = int(soundex1 == soundex2)
+
 	common_parts = len(parts1.intersection(parts2))
 	
 	# Calculate a weighted score
@@ -40,18 +35,25 @@ def name_similarity(name1, name2):
 
 def extract_names(text):
 	print(text)
-	doc = nlp(text)
-	return [ent.text for ent in doc.ents if ent.label_ == "PERSON"]
+	return next(extract_names_batch([(text, None)]))[0]
+
+def extract_names_batch(items, batch_size=64, n_process=1):
+	# items are (text, context) pairs; yields (PERSON names, context) in order, as nlp.pipe finishes each batch
+	for doc, context in get_nlp().pipe(items, as_tuples=True, batch_size=batch_size, n_process=n_process):
+		yield [ent.text for ent in doc.ents if ent.label_ == "PERSON"], context
 
 def match_client_profile(names, client_profiles, threshold=0.8):
+	# only the profiles the name index proposes are scored
+	index = name_index(client_profiles, key=PROFILE_NAME)
 	best_match = None
 	best_score = 0
 	for name in names:
-		for profile in client_profiles:
-			score = name_similarity(name, profile['name'])
+		prepared = prepare_name(name)
+		for i in index.candidates(name):
+			score = prepared_similarity(prepared, index.prepared[i])
 			if score > best_score:
 				best_score = score
-				best_match = profile
+				best_match = client_profiles[i]
 
 	if best_score >= threshold:
 		return best_match, best_score
@@ -59,25 +61,17 @@ def match_client_profile(names, client_profiles, threshold=0.8):
 		return None, best_score
 
 def load_client_profiles(csv_path):
-	client_profiles = []
-	with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
-		reader = csv.DictReader(csvfile)
-		for row in reader:
-			client_profiles.append(row)
-	return client_profiles
+	# parsed once per process and again only when the file changes; the rows are shared, do not modify them
+	return get_profile_store(csv_path).profiles
 
 def groq_get_name(transcript, profiles):
-	client = Groq(
-		api_key="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",
-	)
-
 	# give the transcript
 	# specify the format (json typically)
 	# and give examples
 	# ask it to justify answers (as a second check)
 	# parse the json
 	if transcript:
-		check = client.chat.completions.create(
+		check = get_llm_client().chat_sync(
 			messages=[
 				{
 					"role": "user",
@@ -92,8 +86,16 @@ def groq_get_name(transcript, profiles):
 			],
 			model="llama3-70b-8192"
 		)
-		res = check.choices[0].message.content.strip()
-		return res
+		return check.strip()
+
+def get_from_groq(fulltext, client_profiles):
+	# rate limits and transient errors are retried with backoff by the shared client
+	try:
+		name_from_groq = groq_get_name(fulltext, client_profiles)
+	except Exception as e:
+		print(f"GROQ failed: {e}")
+		return None
+	return name_from_groq or None
 
 def load_file(filename):
 	# print(filename)
@@ -127,19 +129,6 @@ def process_transcript(filename, client_profiles):
 	names = extract_names(fulltext[:500])
 	print(names)
 
-	def get_from_groq(fulltext, client_profiles):
-		name_from_groq = groq_get_name(fulltext, client_profiles)
-		if name_from_groq:
-			return name_from_groq
-		else :
-			print("Waiting 20 seconds and trying again")
-			sleep(65)
-			name_from_groq = groq_get_name(fulltext, client_profiles)
-			if name_from_groq:
-				return name_from_groq
-			else:
-				print("GROQ fail twice")
-				return None
 
 	if names:
 		matched_profile, score = match_client_profile(names, client_profiles)
@@ -167,43 +156,38 @@ def process_transcript(filename, client_profiles):
 
 	return results, failures
 
-def process_transcripts(json_folder, client_profiles):
-	results = Counter()
-	successes = []
-	failures = []
-
+def read_transcripts(json_folder):
+	# (opening of the translated text, filename) for every readable transcript in the folder
 	for filename in os.listdir(json_folder):
 		try:
 			#if json
 			if not filename.endswith('.json'):
 				continue
-			# print(filename)
 			file_path = os.path.join(json_folder, filename)
-			# print(file_path)
-			# fulltext = load_file(file_path)
 			with open(file_path, 'r', encoding='utf-8') as file:
 				data = json.load(file)
 				fulltext = data['result'].get('translated_text', '')
 		except:
 			print("Error")
 			continue
+		yield fulltext, filename
+
+def process_transcripts(json_folder, client_profiles, batch_size=64, n_process=1):
+	results = Counter()
+	successes = []
+	failures = []
+
+	# the transcripts are kept whole for the LLM fallback, only their opening goes through NER
+	fulltexts = {}
+	def openings():
+		for fulltext, filename in read_transcripts(json_folder):
+			fulltexts[filename] = fulltext
+			yield fulltext[:500], filename
 
-		names = extract_names(fulltext[:500])
+	for names, filename in extract_names_batch(openings(), batch_size=batch_size, n_process=n_process):
+		fulltext = fulltexts.pop(filename)
 		print(names)
 
-		def get_from_groq(fulltext, client_profiles):
-			name_from_groq = groq_get_name(fulltext, client_profiles)
-			if name_from_groq:
-				return name_from_groq
-			else :
-				print("Waiting 20 seconds and trying again")
-				sleep(65)
-				name_from_groq = groq_get_name(fulltext, client_profiles)
-				if name_from_groq:
-					return name_from_groq
-				else:
-					print("GROQ fail twice")
-					return None
 
 		if names:
 			matched_profile, score = match_client_profile(names, client_profiles)
@@ -230,6 +214,7 @@ def process_transcripts(json_folder, client_profiles):
 		writer = csv.writer(csvfile)
 		writer.writerow(['rec_id', 'name'])
 		writer.writerows(successes)
+	print(get_llm_client().stats())
 	
 	# Print summary after processing all files
 	print(f"Successes: {results['success']}")
@@ -270,14 +255,17 @@ def find_single_closest_match(name_string, names):
     closest_overall_match = None
     min_distance = float('inf')  # Start with a very high number
 
+    index = name_index(names)
+
     # Loop through each split name to find the single closest match
     for name in split_names:
-        # For each name, find the name from 'names' with the minimum Levenshtein Distance
-        for n in names:
-            current_distance = levenshtein_distance(name, n)
+        # For each name, find the name from 'names' with the minimum Levenshtein Distance,
+        # among the index's candidates, or all names when none shares a trigram or sound with it
+        for i in index.candidates(name) or range(len(names)):
+            current_distance = levenshtein_distance(name, names[i])
             if current_distance < min_distance:
                 min_distance = current_distance
-                closest_overall_match = n
+                closest_overall_match = names[i]
 
     # Return the single closest match found for the entire name string
     return closest_overall_match
@@ -0,0 +1,66 @@
+import os
+import threading
+import functools
+
+# heavy models are loaded on first use, once per process, so importing the detectors stays cheap
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_MODEL_DIR = os.path.join(SRC_DIR, 'fake', 'model')
+GMM_DIR = os.path.join(SRC_DIR, 'impersonator', 'gmms')
+PACKED_SPEAKERS_PATH = os.path.join(SRC_DIR, 'impersonator', 'speakers.bank')
+
+WHISPER_MODEL_NAME = os.environ.get('WHISPER_MODEL', 'tiny')
+SPACY_MODEL_NAME = os.environ.get('SPACY_MODEL', 'en_core_web_sm')
+SPACY_UNUSED_PIPES = ['parser', 'tagger', 'attribute_ruler', 'lemmatizer']
+
+_loaders = {}
+
+
+def load_once(loader):
+	lock = threading.Lock()
+	result = []
+
+	@functools.wraps(loader)
+	def wrapper():
+		# double-checked so concurrent first callers wait for a single load
+		if not result:
+			with lock:
+				if not result:
+					result.append(loader())
+		return result[0]
+
+	wrapper.is_loaded = lambda: bool(result)
+	_loaders[loader.__name__] = wrapper
+	return wrapper
+
+
+@load_once
+def get_whisper_model():
+	import whisper
+	return whisper.load_model(WHISPER_MODEL_NAME)
+
+
+@load_once
+def get_nlp():
+	# only the PERSON entities are used, so the components feeding the parser and lemmas are never loaded
+	import spacy
+	return spacy.load(SPACY_MODEL_NAME, exclude=SPACY_UNUSED_PIPES)
+
+
+@load_once
+def get_fake_model():
+	import joblib
+	svm_classifier = joblib.load(os.path.join(FAKE_MODEL_DIR, "svm_model.pkl"))
+	scaler = joblib.load(os.path.join(FAKE_MODEL_DIR, "scaler.pkl"))
+	return svm_classifier, scaler
+
+
+@load_once
+def get_speaker_bank():
+	from src.impersonator.speaker_store import load_speaker_bank
+	return load_speaker_bank(GMM_DIR, PACKED_SPEAKERS_PATH)
+
+
+def preload(names=None):
+	for name in names or list(_loaders):
+		_loaders[name]()
@@ -0,0 +1,99 @@
+import os
+import math
+import time
+import argparse
+from collections import Counter
+
+import translate
+
+
+def ngrams(tokens, n):
+    return Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+def corpus_bleu(hypotheses, references, max_n=4):
+    # plain corpus BLEU with uniform weights and brevity penalty, on lowercased whitespace tokens
+    matches = [0] * max_n
+    totals = [0] * max_n
+    hyp_length = ref_length = 0
+    for hypothesis, reference in zip(hypotheses, references):
+        hyp_tokens = hypothesis.lower().split()
+        ref_tokens = reference.lower().split()
+        hyp_length += len(hyp_tokens)
+        ref_length += len(ref_tokens)
+        for n in range(1, max_n + 1):
+            hyp_ngrams = ngrams(hyp_tokens, n)
+            ref_ngrams = ngrams(ref_tokens, n)
+            matches[n - 1] += sum(min(count, ref_ngrams[gram]) for gram, count in hyp_ngrams.items())
+            totals[n - 1] += max(len(hyp_tokens) - n + 1, 0)
+
+    if hyp_length == 0 or min(matches) == 0:
+        return 0.0
+    log_precision = sum(math.log(m / t) for m, t in zip(matches, totals)) / max_n
+    brevity = min(0.0, 1 - ref_length / hyp_length)
+    return 100 * math.exp(brevity + log_precision)
+
+
+def load_samples(limit):
+    samples = []
+    for filename in sorted(os.listdir(translate.OUTPUT_DIR)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            _, language, full_text = translate.read_transcript(os.path.join(translate.OUTPUT_DIR, filename))
+        except Exception as e:
+            print(f"Error reading {filename}: {e}")
+            continue
+        if full_text and language != 'en':
+            samples.append((full_text, language))
+        if len(samples) == limit:
+            break
+    return samples
+
+
+def load(quantized):
+    translate.model = None
+    translate.QUANTIZED = quantized
+    start = time.perf_counter()
+    translate.load_model()
+    return time.perf_counter() - start
+
+
+def run(samples, quantized):
+    load_time = load(quantized)
+
+    start = time.perf_counter()
+    translations = translate.translate_many(samples, use_cache=False)
+    return translations, load_time, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fp32 and dynamic int8 MBart on our non-English transcripts")
+    parser.add_argument("--limit", type=int, default=20, help="Number of transcripts to translate")
+    args = parser.parse_args()
+
+    samples = load_samples(args.limit)
+    if not samples:
+        print(f"No non-English transcripts found in {translate.OUTPUT_DIR}")
+        return
+    n_chunks = sum(len(translate.split_sentences(text)) for text, _ in samples)
+    print(f"Translating {len(samples)} transcripts ({n_chunks} sentence chunks)")
+
+    baseline, fp32_load, fp32_time = run(samples, quantized=False)
+    cached = os.path.exists(translate.quantized_model_path())
+    quantized, int8_load, int8_time = run(samples, quantized=True)
+    # the first int8 load quantizes and writes the cache, the one that matters is a load from the cache
+    int8_warm_load = int8_load if cached else load(quantized=True)
+
+    print(f"fp32: load {fp32_load:.1f}s, translate {fp32_time:.1f}s ({n_chunks / fp32_time:.2f} chunks/s)")
+    print(f"int8: load {int8_load:.1f}s ({'cached' if cached else 'quantized and cached'}), "
+          f"translate {int8_time:.1f}s ({n_chunks / int8_time:.2f} chunks/s)")
+    print(f"int8 load from the cache: {int8_warm_load:.1f}s against {fp32_load:.1f}s for fp32")
+    print(f"Speed-up: {fp32_time / int8_time:.2f}x")
+    print(f"BLEU of int8 against fp32: {corpus_bleu(quantized, baseline):.1f}")
+    print(f"fp32 model size: {sum(os.path.getsize(os.path.join(translate.MODEL_DIR, f)) for f in os.listdir(translate.MODEL_DIR)) / 1e9:.2f} GB, "
+          f"int8 model size: {os.path.getsize(translate.quantized_model_path()) / 1e9:.2f} GB")
+
+
+if __name__ == "__main__":
+    main()
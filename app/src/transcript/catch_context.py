@@ -1,15 +1,17 @@
 import os
 import json
-import time
-from groq import Groq
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from jsonpatch import JsonPatch
-
-client = Groq(api_key=os.environ["GROQ_API_KEY"])
+from manifest import Manifest
+from llm_client import get_llm_client, CONCURRENCY
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 INPUT_DIR = os.path.join(BASE_DIR, "audio_clips")
 OUTPUT_DIR = os.path.join(BASE_DIR, "json")
 TEMP_DIR = os.path.join(BASE_DIR, "tmp")
+# bump when the prompt or the extracted fields change, so the manifest redoes every clip
+STAGE_VERSION = 1
 
 def get_info(item, file_id):
     prompt = """Can you extract the name of the person calling? Also retrieve birthday, marital status, account number, tax residency, net worth in millions, profession, social security number, relationship manager. Everything should be in a JSON file with the ID. Here's the input:
@@ -18,7 +20,7 @@ def get_info(item, file_id):
 
 Please structure your response as a JSON object with fields for 'ID', 'Name', 'birthday', 'marital_status', 'account_nr', 'tax_residency', 'net_worth_in_millions', 'profession', 'social_security_number' and 'relationship_manager'. Only include fields in the JSON if the information is available in the input. Do not include fields with null or empty values. Use "{file_id}" as the ID."""
 
-    chat_completion = client.chat.completions.create(
+    return get_llm_client().chat_sync(
         messages=[
             {
                 "role": "system",
@@ -33,8 +35,6 @@ Please structure your response as a JSON object with fields for 'ID', 'Name', 'b
         temperature=0.2,
         max_tokens=300,
     )
-    
-    return chat_completion.choices[0].message.content
 
 def process_json_file(file_path):
     try:
@@ -71,12 +71,36 @@ def process_json_file(file_path):
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
 
+def has_context(file_path):
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return 'context' in json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return False
+
 def main():
-    for filename in os.listdir(OUTPUT_DIR):
-        if filename.endswith('.json'):
-            file_path = os.path.join(OUTPUT_DIR, filename)
-            process_json_file(file_path)
-            time.sleep(2)  # Adding a delay to avoid rate limiting
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="Extract the context of every transcript again, not only new or outdated ones")
+    parser.add_argument("--workers", type=int, default=CONCURRENCY, help="Transcripts processed at once, the client still enforces the rate limits")
+    args = parser.parse_args()
+
+    manifest = Manifest()
+    if args.force:
+        manifest.force("context")
+    clip_ids = [filename[:-len('.json')] for filename in sorted(os.listdir(OUTPUT_DIR)) if filename.endswith('.json')]
+    pending = manifest.pending(clip_ids, "context", STAGE_VERSION)
+    print(f"{len(pending)} of {len(clip_ids)} transcripts to process")
+
+    def process(clip_id):
+        file_path = os.path.join(OUTPUT_DIR, f"{clip_id}.json")
+        process_json_file(file_path)
+        if has_context(file_path):
+            manifest.record(clip_id, "context", STAGE_VERSION, file_path)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(process, pending))
+    manifest.close()
+    print(get_llm_client().stats())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
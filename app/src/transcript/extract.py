@@ -1,8 +1,9 @@
 import json
 import os
 
-JSON_DIR = "/Users/naimdb/JB_SwissHacks/json/"
-OUTPUT_FILE = "/Users/naimdb/JB_SwissHacks/translations_summary.txt"
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+JSON_DIR = os.path.join(BASE_DIR, "json")
+OUTPUT_FILE = os.path.join(BASE_DIR, "translations_summary.txt")
 
 def extract_translations():
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as outfile:
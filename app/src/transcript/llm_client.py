@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+import httpx
+from groq import AsyncGroq, APIConnectionError, APIStatusError
+
+# defaults are the Groq free tier limits, set them to the account's real limits
+RPM = int(os.environ.get("GROQ_RPM", 30))
+TPM = int(os.environ.get("GROQ_TPM", 5000))
+CONCURRENCY = int(os.environ.get("GROQ_CONCURRENCY", 4))
+MAX_RETRIES = 6
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+CACHE_PATH = os.path.join(BASE_DIR, "llm_cache.sqlite")
+# responses are reused for this many days, LLM_CACHE=0 turns the cache off
+CACHE_TTL_DAYS = float(os.environ.get("LLM_CACHE_TTL_DAYS", 30))
+
+
+class TokenBucket:
+    # refills per_minute units per minute, holding at most one minute's worth; waiters are served in arrival order
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def refund(self, amount):
+        # settles an estimate once the real usage is known, a negative amount charges the difference
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMCache:
+    # chat completions keyed by sha256(model, system prompt, user prompt, temperature, max_tokens). Entries expire
+    # after ttl seconds and the least recently used go first once the stored responses exceed max_bytes
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_bytes=256 << 20):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def key(model, messages, temperature=None, max_tokens=None):
+        system = '\n'.join(message['content'] for message in messages if message['role'] == 'system')
+        user = '\n'.join(message['content'] for message in messages if message['role'] != 'system')
+        return hashlib.sha256(json.dumps([model, system, user, temperature, max_tokens]).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ? AND created > ?",
+                                    (key, now - self.ttl)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (key, response, len(response.encode('utf-8')), now, now))
+            self._evict(now)
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+        excess = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self):
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        return f"LLM cache: {self.hits} hits, {self.misses} misses ({ratio:.0%} hit ratio)"
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def retry_after(error):
+    # seconds asked for by the provider's Retry-After header, either a delay or an HTTP date
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    # one connection pool and one set of rate limits for every chat completion in the process.
+    # Requests run on a private event loop thread, so threads and sync code share it through chat_sync
+
+    def __init__(self, api_key=None, base_url=None, rpm=RPM, tpm=TPM, concurrency=CONCURRENCY,
+                 max_retries=MAX_RETRIES, base_backoff=1.0, max_backoff=60.0, cache=None):
+        self.cache = cache
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.paused_until = 0.0
+        self.retries = 0
+        self.client = AsyncGroq(
+            api_key=api_key or os.environ["GROQ_API_KEY"],
+            base_url=base_url,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=60.0,
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            ),
+        )
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-client", daemon=True)
+        self.thread.start()
+
+    def _backoff(self, attempt, error):
+        # full jitter, but never sooner than the provider asked; a Retry-After holds back every request, not just this one
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        wait = retry_after(error)
+        if wait is not None:
+            delay = max(delay, wait)
+            self.paused_until = max(self.paused_until, time.monotonic() + wait)
+        return delay
+
+    async def chat(self, messages, model, temperature=None, max_tokens=None, use_cache=True):
+        key = None
+        if self.cache is not None and use_cache:
+            key = self.cache.key(model, messages, temperature, max_tokens)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        options = {key: value for key, value in (("temperature", temperature), ("max_tokens", max_tokens)) if value is not None}
+        # about four characters per token, plus the completion budget
+        estimate = sum(len(message["content"]) for message in messages) // 4 + (max_tokens or 512)
+
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                await self.requests.acquire()
+                await self.tokens.acquire(estimate)
+                try:
+                    completion = await self.client.chat.completions.create(messages=messages, model=model, **options)
+                except (APIConnectionError, APIStatusError) as e:
+                    status = getattr(e, 'status_code', None)
+                    if (status is not None and status not in RETRY_STATUSES) or attempt == self.max_retries:
+                        raise
+                    delay = self._backoff(attempt, e)
+                    self.retries += 1
+                    print(f"LLM request failed ({status or type(e).__name__}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                if completion.usage is not None:
+                    self.tokens.refund(estimate - completion.usage.total_tokens)
+                response = completion.choices[0].message.content
+                if key is not None and response:
+                    self.cache.put(key, response)
+                return response
+
+    def chat_sync(self, messages, model, temperature=None, max_tokens=None, use_cache=True):
+        return asyncio.run_coroutine_threadsafe(
+            self.chat(messages, model, temperature=temperature, max_tokens=max_tokens, use_cache=use_cache), self.loop
+        ).result()
+
+    def chat_many(self, requests):
+        # requests are keyword dicts for chat; failed requests come back as their exception
+        async def gather():
+            return await asyncio.gather(*(self.chat(**request) for request in requests), return_exceptions=True)
+        return asyncio.run_coroutine_threadsafe(gather(), self.loop).result()
+
+    def stats(self):
+        cache_stats = self.cache.stats() if self.cache is not None else "LLM cache: off"
+        return f"{cache_stats}, {self.retries} retried requests"
+
+
+llm_client = None
+llm_client_lock = threading.Lock()
+
+
+def get_llm_client(concurrency=None):
+    # concurrency overrides GROQ_CONCURRENCY for the call that creates the client; later calls share it as built
+    global llm_client
+    if llm_client is None:
+        with llm_client_lock:
+            if llm_client is None:
+                cache = None
+                if os.environ.get("LLM_CACHE") != "0":
+                    cache = LLMCache(CACHE_PATH, ttl=CACHE_TTL_DAYS * 24 * 3600)
+                llm_client = LLMClient(concurrency=concurrency or CONCURRENCY, cache=cache)
+    return llm_client
@@ -1,37 +1,28 @@
-import subprocess
-import sys
-import time
-
-def run_script(script_path, max_retries=3, retry_delay=5):
-    for attempt in range(max_retries):
-        try:
-            print(f"Running script: {script_path}")
-            result = subprocess.run([sys.executable, script_path], check=True, capture_output=True, text=True)
-            print(f"Script output:\n{result.stdout}")
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"Error running script {script_path}. Attempt {attempt + 1} of {max_retries}")
-            print(f"Error output:\n{e.stderr}")
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                print(f"Max retries reached for {script_path}. Moving to next script.")
-                return False
+import argparse
+from pipeline import run_pipeline
+from manifest import STAGES
 
 def main():
-    scripts_to_run = [
-        "transcribe.py",
-        "translate.py",
-        "extract.py",
-        "catch_context.py",
-]    
+    parser = argparse.ArgumentParser(description="Transcribe, translate and extract the context of every clip in one process")
+    parser.add_argument("--transcribe-workers", type=int, default=1, help="Concurrent whisper.cpp processes, each given cores / workers threads")
+    parser.add_argument("--translate-workers", type=int, default=1, help="Concurrent MBart translations")
+    parser.add_argument("--context-workers", type=int, default=1, help="Concurrent context extraction requests, paced by GROQ_RPM/GROQ_TPM")
+    parser.add_argument("--queue-size", type=int, default=4, help="Clips buffered between two stages")
+    parser.add_argument("--quantized-translation", action="store_true", help="Translate with the dynamic int8 MBart model")
+    parser.add_argument("--force-stage", action="append", choices=STAGES, default=[],
+                        help="Redo this stage, and the stages after it, for every clip (repeatable)")
+    parser.add_argument("--no-summary", action="store_true", help="Skip writing translations_summary.txt at the end")
+    args = parser.parse_args()
 
-    for script in scripts_to_run:
-        success = run_script(script)
-        if not success:
-            print(f"Script {script} failed after max retries. Continuing with next script.")
-        print("-----------------------------------")
+    run_pipeline(
+        transcribe_workers=args.transcribe_workers,
+        translate_workers=args.translate_workers,
+        context_workers=args.context_workers,
+        queue_size=args.queue_size,
+        summary=not args.no_summary,
+        quantized_translation=args.quantized_translation,
+        force_stages=args.force_stage,
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
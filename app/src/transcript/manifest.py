@@ -0,0 +1,87 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+MANIFEST_PATH = os.path.join(BASE_DIR, "pipeline_manifest.sqlite")
+
+# a stage's output is built from the previous stage's, so redoing one stage invalidates every stage after it
+STAGES = ("transcribe", "translate", "context")
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    # per clip: the audio content hash, and for every stage the version that produced its output and where it went.
+    # A stage is current while its row matches the clip's hash and the stage version, and its output still exists
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS clips ("
+                "clip_id TEXT PRIMARY KEY, audio_path TEXT NOT NULL, size INTEGER NOT NULL, "
+                "mtime REAL NOT NULL, content_hash TEXT NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "clip_id TEXT NOT NULL, stage TEXT NOT NULL, version INTEGER NOT NULL, content_hash TEXT, "
+                "output_path TEXT NOT NULL, finished_at REAL NOT NULL, PRIMARY KEY (clip_id, stage))"
+            )
+
+    def update_clip(self, clip_id, audio_path):
+        # the audio is only hashed again when its size or mtime changed since the last run
+        stat = os.stat(audio_path)
+        with self.lock:
+            row = self.conn.execute("SELECT audio_path, size, mtime, content_hash FROM clips WHERE clip_id = ?",
+                                    (clip_id,)).fetchone()
+        if row is not None and row[:3] == (audio_path, stat.st_size, stat.st_mtime):
+            return row[3]
+
+        content_hash = file_hash(audio_path)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?, ?)",
+                              (clip_id, audio_path, stat.st_size, stat.st_mtime, content_hash))
+        return content_hash
+
+    def _clip_hash(self, clip_id):
+        row = self.conn.execute("SELECT content_hash FROM clips WHERE clip_id = ?", (clip_id,)).fetchone()
+        return row[0] if row else None
+
+    def is_current(self, clip_id, stage, version):
+        with self.lock:
+            row = self.conn.execute("SELECT version, content_hash, output_path FROM stages WHERE clip_id = ? AND stage = ?",
+                                    (clip_id, stage)).fetchone()
+            clip_hash = self._clip_hash(clip_id)
+        return row is not None and row[0] == version and row[1] == clip_hash and os.path.exists(row[2])
+
+    def pending(self, clip_ids, stage, version):
+        return [clip_id for clip_id in clip_ids if not self.is_current(clip_id, stage, version)]
+
+    def record(self, clip_id, stage, version, output_path):
+        downstream = STAGES[STAGES.index(stage) + 1:]
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?)",
+                              (clip_id, stage, version, self._clip_hash(clip_id), output_path, time.time()))
+            self.conn.executemany("DELETE FROM stages WHERE clip_id = ? AND stage = ?",
+                                  [(clip_id, later) for later in downstream])
+
+    def force(self, stage):
+        # forget a stage, and the ones built on it, for every clip
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM stages WHERE stage = ?", [(name,) for name in STAGES[STAGES.index(stage):]])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
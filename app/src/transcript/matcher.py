@@ -1,98 +1,180 @@
+import re
 import json
 import csv
+import argparse
+from collections import defaultdict
 from datetime import datetime
-from fuzzywuzzy import fuzz
 
-def calculate_similarity(str1, str2):
-    return fuzz.ratio(str1.lower(), str2.lower())
+import numpy as np
+from rapidfuzz import fuzz, process
 
-def compare_dates(date1, date2):
-    try:
-        d1 = datetime.strptime(date1, "%dth of %B %Y")
-        d2 = datetime.strptime(date2, "%Y-%m-%d")
-        return 100 if d1 == d2 else 0
-    except ValueError:
-        print(f"Erreur de format de date: {date1} ou {date2}")
-        return 0
-
-def calculate_score(json_data, csv_row):
-    total_score = 0
-    total_weight = 0
-
-    weights = {
-        "Name": 3,
-        "Degree": 2,
-        "Date of Birth": 2,
-        "ID": 1
-    }
-
-    mapping = {
-        "Name": "name",
-        "Date of Birth": "birthday",
-        "Degree": "highest_previous_education",
-        "ID": "account_nr"
-    }
-
-    scores = {}
-
-    for json_key, csv_key in mapping.items():
-        if json_key in json_data and csv_key in csv_row:
-            weight = weights.get(json_key, 1)
+WEIGHTS = {
+    "Name": 3,
+    "Degree": 2,
+    "Date of Birth": 2,
+    "ID": 1
+}
+
+MAPPING = {
+    "Name": "name",
+    "Date of Birth": "birthday",
+    "Degree": "highest_previous_education",
+    "ID": "account_nr"
+}
+
+# extractions say "5th of March 1990", the client book has 05.03.1990 (older exports 1990-03-05)
+DATE_FORMATS = ("%d of %B %Y", "%d %B %Y", "%B %d %Y", "%d.%m.%Y", "%Y-%m-%d")
+ORDINAL_SUFFIX = re.compile(r'(?<=\d)(st|nd|rd|th)\b', re.IGNORECASE)
+NO_DATE = -1
+
+
+def parse_date(value):
+    # date ordinal, or NO_DATE when the value is not a date in any known format
+    text = ' '.join(ORDINAL_SUFFIX.sub('', str(value)).replace(',', ' ').split())
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).toordinal()
+        except ValueError:
+            continue
+    return NO_DATE
+
+
+def normalize_account(value):
+    return ''.join(c for c in str(value).upper() if c.isalnum())
+
+
+class BatchMatcher:
+    # the client book normalized and parsed once. Records are looked up in the rows sharing their birth date or
+    # account number prefix, and in the whole book when they have no block or its best score is below
+    # min_block_score (a misheard date or account). Every field is scored in bulk with rapidfuzz
+
+    def __init__(self, rows, account_prefix=4, min_block_score=60, workers=-1, chunk_size=64):
+        self.rows = rows
+        self.account_prefix = account_prefix
+        self.min_block_score = min_block_score
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.text = {json_key: [str(row.get(csv_key, '')).lower() for row in rows]
+                     for json_key, csv_key in MAPPING.items() if json_key != "Date of Birth"}
+        self.birthdays = np.array([parse_date(row.get("birthday", '')) for row in rows])
+
+        self.by_birthday = defaultdict(list)
+        self.by_account = defaultdict(list)
+        for i, row in enumerate(rows):
+            if self.birthdays[i] != NO_DATE:
+                self.by_birthday[self.birthdays[i]].append(i)
+            account = normalize_account(row.get("account_nr", ''))
+            if account:
+                self.by_account[account[:account_prefix]].append(i)
+
+    def candidates(self, record):
+        block = set()
+        if "Date of Birth" in record:
+            block.update(self.by_birthday.get(parse_date(record["Date of Birth"]), ()))
+        if "ID" in record:
+            block.update(self.by_account.get(normalize_account(record["ID"])[:self.account_prefix], ()))
+        return np.array(sorted(block)) if block else None
+
+    def _score(self, records, rows):
+        # weighted average of the field scores, shape (records, rows), plus the per-field matrices for the details
+        total = np.zeros((len(records), len(rows)), dtype=np.float32)
+        weight = np.zeros(len(records), dtype=np.float32)
+        fields = {}
+        for json_key in MAPPING:
+            present = [i for i, record in enumerate(records) if json_key in record]
+            if not present:
+                continue
             if json_key == "Date of Birth":
-                score = compare_dates(json_data[json_key], csv_row[csv_key])
+                dates = np.array([parse_date(records[i][json_key]) for i in present])
+                scores = np.where((dates[:, None] == self.birthdays[rows][None, :]) & (dates[:, None] != NO_DATE), 100.0, 0.0)
             else:
-                score = calculate_similarity(str(json_data[json_key]), str(csv_row[csv_key]))
-            total_score += score * weight
-            total_weight += weight
-            scores[json_key] = score
+                choices = [self.text[json_key][j] for j in rows]
+                queries = [str(records[i][json_key]).lower() for i in present]
+                scores = process.cdist(queries, choices, scorer=fuzz.ratio, workers=self.workers, dtype=np.float32)
+            field = np.zeros_like(total)
+            field[present] = scores
+            fields[json_key] = field
+            total += WEIGHTS[json_key] * field
+            weight[present] += WEIGHTS[json_key]
+        return total / np.maximum(weight, 1)[:, None], fields
+
+    def _top_k(self, record, rows, scores, fields, r, k):
+        row_scores = scores[r]
+        order = np.argsort(-row_scores, kind='stable')[:k]
+        return [(self.rows[rows[j]], float(row_scores[j]),
+                 {key: float(field[r, j]) for key, field in fields.items() if key in record})
+                for j in order if row_scores[j] > 0]
+
+    def match(self, records, k=3):
+        # for every record, up to k (row, score, field scores) with a positive score, best first
+        results = [None] * len(records)
+        unblocked = []
+        for i, record in enumerate(records):
+            rows = self.candidates(record)
+            if rows is None:
+                unblocked.append(i)
+                continue
+            scores, fields = self._score([record], rows)
+            results[i] = self._top_k(record, rows, scores, fields, 0, k)
+            if not results[i] or results[i][0][1] < self.min_block_score:
+                unblocked.append(i)
+
+        # records without a block are scored against the whole book, a chunk of records per cdist call
+        everything = np.arange(len(self.rows))
+        for start in range(0, len(unblocked), self.chunk_size):
+            chunk = unblocked[start:start + self.chunk_size]
+            scores, fields = self._score([records[i] for i in chunk], everything)
+            for r, i in enumerate(chunk):
+                results[i] = self._top_k(records[i], everything, scores, fields, r, k)
+        return results
 
-    return total_score / total_weight if total_weight > 0 else 0, scores
 
 def find_best_match(json_data, csv_data):
-    best_match = None
-    best_score = 0
-
-    for row in csv_data:
-        score, details = calculate_score(json_data, row)
-        if score > best_score:
-            best_score = score
-            best_match = row
-
-    return best_match, best_score, details
-
-# Charger les données JSON
-try:
-    with open('extracted_info.json', 'r') as json_file:
-        json_data_list = json.load(json_file)
-    print(f"Nombre d'éléments JSON chargés: {len(json_data_list)}")
-except Exception as e:
-    print(f"Erreur lors de la lecture du fichier JSON: {e}")
-    exit()
-
-# Lire le fichier CSV
-try:
-    with open('client_features.csv', 'r') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        csv_data = list(csv_reader)
-    print(f"Nombre de lignes dans le CSV: {len(csv_data)}")
-except Exception as e:
-    print(f"Erreur lors de la lecture du fichier CSV: {e}")
-    exit()
-
-# Traiter chaque élément JSON
-for i, json_data in enumerate(json_data_list):
-    print(f"\nTraitement de l'élément JSON #{i+1}:")
-    best_match, best_score, details = find_best_match(json_data, csv_data)
-    
-    if best_match:
-        print(f"Meilleure correspondance trouvée avec un score de {best_score:.2f}:")
-        print(json.dumps(best_match, indent=2))
-        print("Détails du score:")
-        for key, score in details.items():
-            print(f"{key}: {score:.2f}")
-    else:
-        print("Aucune correspondance trouvée.")
-
-    print(f"JSON original:")
-    print(json.dumps(json_data, indent=2))
-    print("-" * 50)
\ No newline at end of file
+    matches = BatchMatcher(csv_data).match([json_data], k=1)[0]
+    return matches[0] if matches else (None, 0, {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Link extracted records to the client book")
+    parser.add_argument("--records", default="extracted_info.json", help="JSON list of extracted records")
+    parser.add_argument("--clients", default="client_features.csv", help="Client book CSV")
+    parser.add_argument("--top-k", type=int, default=3, help="Matches reported per record")
+    parser.add_argument("--workers", type=int, default=-1, help="rapidfuzz threads (-1: all cores)")
+    args = parser.parse_args()
+
+    # Charger les données JSON
+    try:
+        with open(args.records, 'r') as json_file:
+            json_data_list = json.load(json_file)
+        print(f"Nombre d'éléments JSON chargés: {len(json_data_list)}")
+    except Exception as e:
+        print(f"Erreur lors de la lecture du fichier JSON: {e}")
+        return
+
+    # Lire le fichier CSV
+    try:
+        with open(args.clients, 'r') as csv_file:
+            csv_data = list(csv.DictReader(csv_file))
+        print(f"Nombre de lignes dans le CSV: {len(csv_data)}")
+    except Exception as e:
+        print(f"Erreur lors de la lecture du fichier CSV: {e}")
+        return
+
+    matcher = BatchMatcher(csv_data, workers=args.workers)
+    for i, (json_data, matches) in enumerate(zip(json_data_list, matcher.match(json_data_list, k=args.top_k))):
+        print(f"\nTraitement de l'élément JSON #{i+1}:")
+        if not matches:
+            print("Aucune correspondance trouvée.")
+        for rank, (row, score, details) in enumerate(matches, 1):
+            print(f"Correspondance #{rank} avec un score de {score:.2f}:")
+            print(json.dumps(row, indent=2))
+            print("Détails du score:")
+            for key, field_score in details.items():
+                print(f"{key}: {field_score:.2f}")
+
+        print(f"JSON original:")
+        print(json.dumps(json_data, indent=2))
+        print("-" * 50)
+
+if __name__ == "__main__":
+    main()
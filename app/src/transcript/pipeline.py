@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import queue
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+
+import transcribe
+import translate
+import catch_context
+import extract
+from manifest import Manifest, MANIFEST_PATH
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a')
+_DONE = object()
+
+
+@dataclass
+class ClipJob:
+    clip_id: str
+    audio_path: str
+    json_path: str
+    failed_stage: str = None
+    timings: dict = field(default_factory=dict)
+
+
+class Stage(ABC):
+    name = None
+    version = None
+
+    def __init__(self, workers=1):
+        self.workers = workers
+
+    def setup(self):
+        pass
+
+    @abstractmethod
+    def process(self, job):
+        # True when the clip's output for this stage was written
+        pass
+
+
+class TranscribeStage(Stage):
+    name = "transcribe"
+    version = transcribe.STAGE_VERSION
+
+    def setup(self):
+        transcribe.clean_temp_dir()
+        transcribe.setup_dirs()
+        self.threads = transcribe.threads_per_process(self.workers)
+
+    def process(self, job):
+        return transcribe.transcribe_clip(os.path.basename(job.audio_path), threads=self.threads) is not None
+
+
+class TranslateStage(Stage):
+    name = "translate"
+    version = translate.STAGE_VERSION
+
+    def setup(self):
+        translate.load_model()
+
+    def process(self, job):
+        return translate.process_json_file(job.json_path)
+
+
+class ContextStage(Stage):
+    name = "context"
+    version = catch_context.STAGE_VERSION
+
+    def process(self, job):
+        # pacing is left to the shared LLM client's rate limiter
+        catch_context.process_json_file(job.json_path)
+        return 'context' in _load_json(job.json_path)
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+class Pipeline:
+    # stages run concurrently, connected by bounded queues, so clip 1 is translated while clip 2 is transcribed
+
+    def __init__(self, stages, queue_size=4, manifest_path=MANIFEST_PATH):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.manifest = Manifest(manifest_path)
+        self.up_to_date = 0
+
+    def _run_stage(self, stage, inbox, outbox, remaining, remaining_lock):
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                # the last worker of a stage to finish closes the next queue
+                with remaining_lock:
+                    remaining[stage.name] -= 1
+                    last = remaining[stage.name] == 0
+                if last:
+                    outbox.put(_DONE)
+                else:
+                    inbox.put(_DONE)
+                return
+
+            if job.failed_stage is None and not self.manifest.is_current(job.clip_id, stage.name, stage.version):
+                start = time.perf_counter()
+                try:
+                    ok = stage.process(job)
+                except Exception as e:
+                    print(f"Error in stage {stage.name} for {job.clip_id}: {e}")
+                    ok = False
+                job.timings[stage.name] = time.perf_counter() - start
+                if ok:
+                    self.manifest.record(job.clip_id, stage.name, stage.version, job.json_path)
+                else:
+                    job.failed_stage = stage.name
+            outbox.put(job)
+
+    def run(self, jobs):
+        for stage in self.stages:
+            stage.setup()
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        remaining = {stage.name: stage.workers for stage in self.stages}
+        remaining_lock = threading.Lock()
+        threads = []
+        for stage, inbox, outbox in zip(self.stages, queues, queues[1:]):
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._run_stage, args=(stage, inbox, outbox, remaining, remaining_lock),
+                                          name=f"{stage.name}-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        def feed():
+            # clips are hashed here, overlapping the first stage, and clips with every stage current never enter a queue
+            for job in jobs:
+                try:
+                    self.manifest.update_clip(job.clip_id, job.audio_path)
+                except OSError as e:
+                    print(f"Error reading {job.audio_path}: {e}")
+                    continue
+                if all(self.manifest.is_current(job.clip_id, stage.name, stage.version) for stage in self.stages):
+                    self.up_to_date += 1
+                    continue
+                queues[0].put(job)
+            queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        results = []
+        while True:
+            job = queues[-1].get()
+            if job is _DONE:
+                break
+            results.append(job)
+            status = f"failed at {job.failed_stage}" if job.failed_stage else "done"
+            timings = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in job.timings.items())
+            print(f"[{len(results)}] {job.clip_id}: {status} ({timings or 'no stage to run'})")
+
+        for thread in threads:
+            thread.join()
+        return results
+
+
+def discover_jobs(input_dir=transcribe.INPUT_DIR, output_dir=transcribe.OUTPUT_DIR):
+    jobs = []
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.endswith(AUDIO_EXTENSIONS):
+            clip_id = os.path.splitext(filename)[0]
+            jobs.append(ClipJob(clip_id, os.path.join(input_dir, filename), os.path.join(output_dir, f"{clip_id}.json")))
+    return jobs
+
+
+def run_pipeline(transcribe_workers=1, translate_workers=1, context_workers=1, queue_size=4,
+                 manifest_path=MANIFEST_PATH, summary=True, quantized_translation=False, force_stages=()):
+    translate.QUANTIZED = translate.QUANTIZED or quantized_translation
+    stages = [
+        TranscribeStage(transcribe_workers),
+        TranslateStage(translate_workers),
+        ContextStage(context_workers),
+    ]
+    transcribe.setup_dirs()
+    start = time.perf_counter()
+    pipeline = Pipeline(stages, queue_size=queue_size, manifest_path=manifest_path)
+    for stage_name in force_stages:
+        pipeline.manifest.force(stage_name)
+    results = pipeline.run(discover_jobs())
+    pipeline.manifest.close()
+    failed = [job for job in results if job.failed_stage]
+    print(f"Processed {len(results)} clips in {time.perf_counter() - start:.1f}s, {len(failed)} failed, "
+          f"{pipeline.up_to_date} already up to date")
+
+    if summary:
+        extract.extract_translations()
+    return results
@@ -1,73 +1,115 @@
+import io
 import os
 import subprocess
 import json
 import locale
 import shutil
-from transformers import MarianMTModel, MarianTokenizer
+import time
+import wave
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from manifest import Manifest
 
 FFMPEG_EXEC = "ffmpeg"
 WHISPER_EXEC = os.path.expanduser("~/whisper.cpp/main")
 MODEL_PATH = os.path.expanduser("~/whisper.cpp/models/ggml-large-v3.bin")
+# bump when the whisper model or the transcript format changes, so the manifest redoes every clip
+STAGE_VERSION = 1
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 INPUT_DIR = os.path.join(BASE_DIR, "audio_clips")
 OUTPUT_DIR = os.path.join(BASE_DIR, "json")
 TEMP_DIR = os.path.join(BASE_DIR, "tmp")
 
-def convert_audio(input_file, output_file):
+def is_whisper_ready(path):
+    # whisper.cpp reads 16 kHz mono 16-bit PCM wav as is, anything else goes through ffmpeg first
+    try:
+        with wave.open(path, 'rb') as f:
+            return (f.getframerate() == 16000 and f.getnchannels() == 1
+                    and f.getsampwidth() == 2 and f.getcomptype() == 'NONE')
+    except (OSError, EOFError, wave.Error):
+        return False
+
+def convert_audio(input_file):
+    # ffmpeg decodes to raw PCM on stdout and the wav header is written here, so the clip never touches disk;
+    # a header written by ffmpeg to a pipe has no data size
     command = [
         FFMPEG_EXEC,
+        "-loglevel", "error",
         "-i", input_file,
         "-ar", "16000",
-        output_file
+        "-ac", "1",
+        "-f", "s16le",
+        "-"
     ]
     try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
-        print(f"Conversion successful: {input_file} -> {output_file}")
+        result = subprocess.run(command, check=True, capture_output=True)
     except subprocess.CalledProcessError as e:
         print(f"Error during audio conversion: {e}")
-        print(f"Error output: {e.stderr}")
+        print(f"Error output: {e.stderr.decode(locale.getpreferredencoding(), errors='replace')}")
+        return None
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(result.stdout)
+    print(f"Conversion successful: {input_file}")
+    return buffer.getvalue()
+
+def threads_per_process(workers):
+    # whisper.cpp scales well up to the physical cores, so the cores are split evenly between the processes
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
 
-def transcribe_file(input_file, output_json):
-    input_dir = os.path.dirname(input_file)
+def audio_seconds(path):
+    try:
+        with wave.open(path, 'rb') as f:
+            return f.getnframes() / f.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+def transcribe_file(input_file, output_json, threads=None, wav_bytes=None):
+    # whisper.cpp writes <output_base>.json, so concurrent transcriptions never see each other's files;
+    # converted audio is passed as wav_bytes and read by whisper.cpp from stdin
+    output_base = os.path.join(TEMP_DIR, os.path.splitext(os.path.basename(output_json))[0])
+    generated_json = output_base + '.json'
     command = [
         WHISPER_EXEC,
         "-m", MODEL_PATH,
-        "-f", os.path.abspath(input_file),
+        "-f", "-" if wav_bytes is not None else os.path.abspath(input_file),
         "-l", "auto",
-        "-oj"
+        "-t", str(threads or threads_per_process(1)),
+        "-oj",
+        "-of", output_base
     ]
+    system_encoding = locale.getpreferredencoding()
     try:
-        system_encoding = locale.getpreferredencoding()
-        result = subprocess.run(command, check=True, capture_output=True, encoding=system_encoding, errors='replace')
+        subprocess.run(command, input=wav_bytes, check=True, capture_output=True)
         print("Transcription successful.")
-        
-        json_files = [f for f in os.listdir(input_dir) if f.endswith('.json')]
-        if json_files:
-            generated_json = os.path.join(input_dir, json_files[0])
-            print(f"JSON file found: {generated_json}")
-            
-            try:
-                with open(generated_json, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except UnicodeDecodeError:
-                with open(generated_json, 'r', encoding=system_encoding) as f:
-                    data = json.load(f)
-            
-            if 'params' in data:
-                data['params']['translate'] = False
-            
-            with open(output_json, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            print(f"Modified JSON file saved: {output_json}")
-        else:
-            print(f"Warning: No JSON file found in {input_dir}")
-            print("Folder contents:")
-            print(os.listdir(input_dir))
+
+        if not os.path.exists(generated_json):
+            print(f"Warning: whisper.cpp did not write {generated_json}")
+            return
+
+        try:
+            with open(generated_json, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except UnicodeDecodeError:
+            with open(generated_json, 'r', encoding=system_encoding) as f:
+                data = json.load(f)
+        os.remove(generated_json)
+
+        if 'params' in data:
+            data['params']['translate'] = False
+
+        with open(output_json, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+        print(f"Modified JSON file saved: {output_json}")
     except subprocess.CalledProcessError as e:
         print(f"Error during transcription: {e}")
-        print(f"Error output: {e.stderr}")
+        print(f"Error output: {e.stderr.decode(system_encoding, errors='replace')}")
     except Exception as e:
         print(f"Unexpected error: {e}")
 
@@ -86,37 +128,90 @@ def process_json(input_json, output_json):
     except Exception as e:
         print(f"Error while processing JSON: {e}")
 
-def main():
+def transcribe_clip(filename, threads=None):
+    input_path = os.path.join(INPUT_DIR, filename)
+    output_json = os.path.join(OUTPUT_DIR, f"{os.path.splitext(filename)[0]}.json")
+
+    print(f"Processing {filename}...")
+
+    if is_whisper_ready(input_path):
+        transcribe_file(input_path, output_json, threads=threads)
+    else:
+        wav_bytes = convert_audio(input_path)
+        if wav_bytes is not None:
+            transcribe_file(input_path, output_json, threads=threads, wav_bytes=wav_bytes)
+        else:
+            print(f"Error: {filename} could not be converted to 16 kHz mono.")
+
+    if os.path.exists(output_json):
+        process_json(output_json, output_json)
+
+    print(f"Processing completed for {filename}")
+    return output_json if os.path.exists(output_json) else None
+
+def clean_temp_dir():
+    if os.path.exists(TEMP_DIR):
+        shutil.rmtree(TEMP_DIR)
+        print(f"Temporary directory {TEMP_DIR} has been deleted.")
+
+def setup_dirs():
     for directory in [INPUT_DIR, OUTPUT_DIR, TEMP_DIR]:
         if not os.path.exists(directory):
             os.makedirs(directory)
             print(f"Folder created: {directory}")
 
-    for filename in os.listdir(INPUT_DIR):
-        if filename.endswith(('.wav', '.mp3', '.m4a')):
-            input_path = os.path.join(INPUT_DIR, filename)
-            temp_wav = os.path.join(TEMP_DIR, f"{os.path.splitext(filename)[0]}_16khz.wav")
-            output_json = os.path.join(OUTPUT_DIR, f"{os.path.splitext(filename)[0]}.json")
-
-            print(f"Processing {filename}...")
-            
-            convert_audio(input_path, temp_wav)
-            
-            if os.path.exists(temp_wav):
-                transcribe_file(temp_wav, output_json)
-                
-                if os.path.exists(output_json):
-                    process_json(output_json, output_json)
-                
-                os.remove(temp_wav)
-            else:
-                print(f"Error: Temporary file {temp_wav} was not created.")
-
-            print(f"Processing completed for {filename}")
-            
-if os.path.exists(TEMP_DIR):
-    shutil.rmtree(TEMP_DIR)
-    print(f"Temporary directory {TEMP_DIR} has been deleted.")
+def transcribe_all(filenames, workers=1, threads=None):
+    # each worker thread drives one whisper.cpp process; the processes share the cores between them
+    threads = threads or threads_per_process(workers)
+    print(f"Transcribing {len(filenames)} clips with {workers} whisper.cpp processes x {threads} threads")
+
+    def timed(filename):
+        start = time.perf_counter()
+        output_json = transcribe_clip(filename, threads=threads)
+        return output_json, audio_seconds(os.path.join(INPUT_DIR, filename)), time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(timed, filenames))
+    wall_time = time.perf_counter() - start
+
+    failed = sum(output_json is None for output_json, _, _ in results)
+    audio_total = sum(seconds for _, seconds, _ in results if seconds)
+    print(f"Transcribed {len(filenames) - failed}/{len(filenames)} clips in {wall_time:.1f}s wall time")
+    if audio_total:
+        # real-time factor: processing time per second of audio, below 1 is faster than real time
+        process_total = sum(elapsed for _, seconds, elapsed in results if seconds)
+        print(f"{audio_total:.1f}s of audio, real-time factor {process_total / audio_total:.3f} per process, "
+              f"{wall_time / audio_total:.3f} overall")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe every clip in audio_clips with whisper.cpp")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent whisper.cpp processes")
+    parser.add_argument("--threads", type=int, default=None, help="Threads per process (default: cores / workers)")
+    parser.add_argument("--force", action="store_true", help="Transcribe every clip again, not only new or changed ones")
+    args = parser.parse_args()
+
+    clean_temp_dir()
+    setup_dirs()
+
+    manifest = Manifest()
+    if args.force:
+        manifest.force("transcribe")
+    filenames = []
+    all_filenames = sorted(f for f in os.listdir(INPUT_DIR) if f.endswith(('.wav', '.mp3', '.m4a')))
+    for filename in all_filenames:
+        clip_id = os.path.splitext(filename)[0]
+        manifest.update_clip(clip_id, os.path.join(INPUT_DIR, filename))
+        if not manifest.is_current(clip_id, "transcribe", STAGE_VERSION):
+            filenames.append(filename)
+    print(f"{len(filenames)} of {len(all_filenames)} clips are new or changed")
+
+    results = transcribe_all(filenames, workers=args.workers, threads=args.threads)
+    for filename, (output_json, _, _) in zip(filenames, results):
+        if output_json is not None:
+            manifest.record(os.path.splitext(filename)[0], "transcribe", STAGE_VERSION, output_json)
+    manifest.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
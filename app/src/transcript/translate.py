@@ -1,6 +1,16 @@
+import re
 import json
+import argparse
 import os
-from transformers import MBartForConditionalGeneration, MBart50TokenizerFast, GenerationConfig
+import glob
+import hashlib
+import threading
+import torch
+from collections import defaultdict
+from translation_cache import TranslationCache
+from manifest import Manifest
+from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+from transformers import MBartConfig, MBartForConditionalGeneration, MBart50TokenizerFast, GenerationConfig
 
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
@@ -10,90 +20,305 @@ TEMP_DIR = os.path.join(BASE_DIR, "tmp")
 
 MODEL_DIR = os.path.join(BASE_DIR, "local_mbart_model")
 TOKENIZER_DIR = os.path.join(BASE_DIR, "local_mbart_tokenizer")
+MODEL_ID = 'facebook/mbart-large-50-many-to-many-mmt'
+CACHE_PATH = os.path.join(BASE_DIR, "translation_cache.sqlite")
+QUANTIZED_MODEL_PREFIX = os.path.join(BASE_DIR, "local_mbart_model_int8")
+# bump when the translation output changes, so the manifest redoes every clip
+STAGE_VERSION = 1
 
-if not os.path.exists(MODEL_DIR) or not os.path.exists(TOKENIZER_DIR):
-    print("Local model not found. Downloading model...")
-    from transformers import MBartForConditionalGeneration, MBart50TokenizerFast
-    model = MBartForConditionalGeneration.from_pretrained('facebook/mbart-large-50-many-to-many-mmt')
-    tokenizer = MBart50TokenizerFast.from_pretrained('facebook/mbart-large-50-many-to-many-mmt')
-    model.save_pretrained(MODEL_DIR)
-    tokenizer.save_pretrained(TOKENIZER_DIR)
-    print("Model downloaded and saved locally.")
+# opt-in int8 CPU inference, set before the model is first loaded
+QUANTIZED = os.environ.get("MBART_QUANTIZED") == "1"
 
-model = MBartForConditionalGeneration.from_pretrained(MODEL_DIR)
-tokenizer = MBart50TokenizerFast.from_pretrained(TOKENIZER_DIR)
+model = None
+tokenizer = None
+generation_config = None
+model_lock = threading.Lock()
+tokenizer_lock = threading.Lock()
+caches = {}
+cache_lock = threading.Lock()
 
-generation_config = GenerationConfig.from_model_config(model.config)
-generation_config.max_length = 200
-generation_config.early_stopping = True
-generation_config.num_beams = 5
-generation_config.forced_eos_token_id = 2
+def get_cache():
+    # one cache per mode, QUANTIZED can change between calls (benchmark_translation.py runs both)
+    with cache_lock:
+        if QUANTIZED not in caches:
+            caches[QUANTIZED] = TranslationCache(CACHE_PATH, MODEL_ID, MODEL_DIR, QUANTIZED)
+        return caches[QUANTIZED]
+
+def load_model():
+    with model_lock:
+        _load_model()
+
+def download_model():
+    if not os.path.exists(MODEL_DIR) or not os.path.exists(TOKENIZER_DIR):
+        print("Local model not found. Downloading model...")
+        downloaded_model = MBartForConditionalGeneration.from_pretrained(MODEL_ID)
+        downloaded_tokenizer = MBart50TokenizerFast.from_pretrained(MODEL_ID)
+        downloaded_model.save_pretrained(MODEL_DIR)
+        downloaded_tokenizer.save_pretrained(TOKENIZER_DIR)
+        print("Model downloaded and saved locally.")
+
+def model_fingerprint(model_dir=MODEL_DIR):
+    # the fp32 model files (name, size, mtime) and the torch version, which decides the packed int8 layout
+    digest = hashlib.sha1(torch.__version__.encode('utf-8'))
+    for root, dirs, files in os.walk(model_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, model_dir)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def quantized_model_path():
+    return f"{QUANTIZED_MODEL_PREFIX}-{model_fingerprint(MODEL_DIR)}.pt"
+
+def quantized_skeleton():
+    # the module layout quantize_dynamic produces, without weights: parameters stay on the meta device and every
+    # Linear is an empty dynamic int8 Linear. quantize_dynamic itself cannot run here, it needs real weights to scale
+    with torch.device("meta"):
+        skeleton = MBartForConditionalGeneration(MBartConfig.from_pretrained(MODEL_DIR))
+    for parent in list(skeleton.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child) is torch.nn.Linear:
+                setattr(parent, name, DynamicQuantizedLinear(child.in_features, child.out_features,
+                                                             bias_=child.bias is not None, dtype=torch.qint8))
+    return skeleton
+
+def build_model(quantized=False):
+    download_model()
+    if not quantized:
+        return MBartForConditionalGeneration.from_pretrained(MODEL_DIR)
+
+    # dynamic int8 quantization of the linear layers. Only the quantized weights are cached, as a plain state_dict,
+    # so loading never unpickles code, and a cached copy is loaded without reading or allocating the fp32 model
+    path = quantized_model_path()
+    if os.path.exists(path):
+        quantized_model = quantized_skeleton()
+        quantized_model.load_state_dict(torch.load(path, weights_only=True), assign=True)
+        return quantized_model.eval()
+
+    print("Quantizing the translation model to int8...")
+    fp32_model = MBartForConditionalGeneration.from_pretrained(MODEL_DIR).eval()
+    quantized_model = torch.quantization.quantize_dynamic(fp32_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    torch.save(quantized_model.state_dict(), path)
+    # weights quantized from an older fp32 model or torch version are never read again
+    for stale in glob.glob(f"{QUANTIZED_MODEL_PREFIX}*.pt"):
+        if stale != path:
+            os.remove(stale)
+    print(f"Quantized model saved to {path}")
+    return quantized_model
+
+def _load_model():
+    global model, tokenizer, generation_config
+    if model is not None:
+        return
+
+    loaded_model = build_model(QUANTIZED)
+    tokenizer = MBart50TokenizerFast.from_pretrained(TOKENIZER_DIR)
+
+    generation_config = GenerationConfig.from_model_config(loaded_model.config)
+    generation_config.early_stopping = True
+    generation_config.num_beams = 5
+    generation_config.forced_eos_token_id = 2
+    model = loaded_model
+
+LANG_MAPPING = {
+    'zh': 'zh_CN', 'ja': 'ja_XX', 'ko': 'ko_KR', 'vi': 'vi_VN', 'id': 'id_ID',
+    'th': 'th_TH', 'ms': 'ms_MY', 'ar': 'ar_AR', 'tr': 'tr_TR', 'ru': 'ru_RU',
+    'de': 'de_DE', 'nl': 'nl_XX', 'sv': 'sv_SE', 'it': 'it_IT', 'fr': 'fr_XX',
+    'es': 'es_XX', 'pt': 'pt_XX', 'hi': 'hi_IN', 'ta': 'ta_IN', 'ur': 'ur_PK',
+    'fa': 'fa_IR', 'ne': 'ne_NP', 'si': 'si_LK', 'en': 'en_XX'
+}
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[\u3002\uff01\uff1f])\s*')
+MAX_CHUNK_WORDS = 120
+TOKEN_BUDGET = 2048
+MAX_BATCH_SIZE = 16
+
+def split_sentences(text):
+    # sentence chunks, with run-on sentences cut every MAX_CHUNK_WORDS words
+    chunks = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        words = sentence.split()
+        for start in range(0, len(words), MAX_CHUNK_WORDS):
+            chunks.append(' '.join(words[start:start + MAX_CHUNK_WORDS]))
+    return chunks
+
+def make_batches(lengths, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    # lengths must be sorted; a batch is padded to its longest chunk, so its cost is size * longest
+    batches = []
+    batch = []
+    for i, length in enumerate(lengths):
+        if batch and ((len(batch) + 1) * length > token_budget or len(batch) == max_batch_size):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def translate_many(items, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE, use_cache=True):
+    # items are (text, src_lang) pairs; chunks of the same language are batched together across items
+    chunks_by_lang = defaultdict(list)
+    chunk_counts = []
+    for item_index, (text, src_lang) in enumerate(items):
+        chunks = split_sentences(text)
+        chunk_counts.append(len(chunks))
+        for chunk_index, chunk in enumerate(chunks):
+            chunks_by_lang[LANG_MAPPING.get(src_lang, src_lang)].append((item_index, chunk_index, chunk))
+
+    translated = [[None] * count for count in chunk_counts]
+    for src_lang, chunks in chunks_by_lang.items():
+        # cached sentences are filled in directly, only the rest go through MBart
+        if use_cache:
+            for i, translation in get_cache().get_many(src_lang, [chunk for _, _, chunk in chunks]).items():
+                item_index, chunk_index, _ = chunks[i]
+                translated[item_index][chunk_index] = translation
+            chunks = [chunk for chunk in chunks if translated[chunk[0]][chunk[1]] is None]
+        if not chunks:
+            continue
+
+        load_model()
+        texts = [chunk for _, _, chunk in chunks]
+        # src_lang is tokenizer state, so concurrent translations must not interleave here
+        with tokenizer_lock:
+            tokenizer.src_lang = src_lang
+            lengths = [len(ids) for ids in tokenizer(texts)['input_ids']]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+        for batch in make_batches([lengths[i] for i in order], token_budget, max_batch_size):
+            indices = [order[i] for i in batch]
+            with tokenizer_lock:
+                tokenizer.src_lang = src_lang
+                encoded = tokenizer([texts[i] for i in indices], return_tensors="pt", padding=True)
+            longest = encoded['input_ids'].shape[1]
+            generated_tokens = model.generate(
+                **encoded,
+                forced_bos_token_id=tokenizer.lang_code_to_id["en_XX"],
+                generation_config=generation_config,
+                max_new_tokens=2 * longest + 10
+            )
+            translations = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+            for i, translation in zip(indices, translations):
+                item_index, chunk_index, _ = chunks[i]
+                translated[item_index][chunk_index] = translation
+            if use_cache:
+                get_cache().put_many(src_lang, [(texts[i], translation) for i, translation in zip(indices, translations)])
+
+    return [' '.join(chunks) for chunks in translated]
 
 def translate_to_english(text, src_lang):
     try:
-        lang_mapping = {
-            'zh': 'zh_CN', 'ja': 'ja_XX', 'ko': 'ko_KR', 'vi': 'vi_VN', 'id': 'id_ID',
-            'th': 'th_TH', 'ms': 'ms_MY', 'ar': 'ar_AR', 'tr': 'tr_TR', 'ru': 'ru_RU',
-            'de': 'de_DE', 'nl': 'nl_XX', 'sv': 'sv_SE', 'it': 'it_IT', 'fr': 'fr_XX',
-            'es': 'es_XX', 'pt': 'pt_XX', 'hi': 'hi_IN', 'ta': 'ta_IN', 'ur': 'ur_PK',
-            'fa': 'fa_IR', 'ne': 'ne_NP', 'si': 'si_LK', 'en': 'en_XX'
-        }
-        
-        src_lang = lang_mapping.get(src_lang, src_lang)
-        tokenizer.src_lang = src_lang
-        
-        encoded = tokenizer(text, return_tensors="pt")
-        generated_tokens = model.generate(
-            **encoded, 
-            forced_bos_token_id=tokenizer.lang_code_to_id["en_XX"],
-            generation_config=generation_config
-        )
-        translated_text = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)[0]
+        translated_text = translate_many([(text, src_lang)])[0]
         
         if not all(ord(char) < 128 for char in translated_text):
-            print(f"Warning: Translation may not be in English. Source language: {src_lang}")
+            print(f"Warning: Translation may not be in English. Source language: {LANG_MAPPING.get(src_lang, src_lang)}")
         
         return translated_text
     except Exception as e:
+        # None rather than the source text, which would otherwise be written and recorded as its translation
         print(f"Error during translation: {e}")
-        return text
+        return None
+
+def read_transcript(input_json):
+    with open(input_json, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    full_text = None
+    if 'transcription' in data:
+        full_text = ' '.join(item['text'].strip() for item in data['transcription'])
+    return data, data['result']['language'], full_text
+
+def write_translation(input_json, data, language, full_text, translated_text):
+    # True when translated_text was written; a failed or non-English translation leaves the file untouched
+    if full_text is not None:
+        if language != 'en':
+            if translated_text is None:
+                print(f"Translation failed for {input_json}. Skipping.")
+                return False
+            if not all(ord(char) < 128 for char in translated_text):
+                print(f"Warning: Translation for {input_json} may not be in English. Skipping.")
+                return False
+            data['result']['translated_text'] = translated_text
+        else:
+            data['result']['translated_text'] = full_text
+    
+    with open(input_json, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2, ensure_ascii=False)
+    
+    print(f"Processing completed for {input_json}")
+    return full_text is not None
 
 def process_json_file(input_json):
     try:
-        with open(input_json, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        
-        language = data['result']['language']
-        
-        if 'transcription' in data:
-            full_text = ' '.join(item['text'].strip() for item in data['transcription'])
-            
-            if language != 'en':
-                translated_text = translate_to_english(full_text, language)
-                if not all(ord(char) < 128 for char in translated_text):
-                    print(f"Warning: Translation for {input_json} may not be in English. Skipping.")
-                    return
-                data['result']['translated_text'] = translated_text
-            else:
-                data['result']['translated_text'] = full_text
-        
-        with open(input_json, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=2, ensure_ascii=False)
-        
-        print(f"Processing completed for {input_json}")
+        data, language, full_text = read_transcript(input_json)
+        translated_text = None
+        if full_text is not None and language != 'en':
+            translated_text = translate_to_english(full_text, language)
+        return write_translation(input_json, data, language, full_text, translated_text)
     except Exception as e:
         print(f"Error processing {input_json}: {e}")
+        return False
+
+def translate_files(input_jsons, files_per_batch=32, force=False):
+    # chunks from several transcripts share batches, so short calls in the same language fill each other's padding.
+    # Returns the files whose translation was written
+    written = []
+    for start in range(0, len(input_jsons), files_per_batch):
+        transcripts = []
+        for input_json in input_jsons[start:start + files_per_batch]:
+            try:
+                transcript = read_transcript(input_json)
+            except Exception as e:
+                print(f"Error processing {input_json}: {e}")
+                continue
+            if not force and 'translated_text' in transcript[0]['result']:
+                print(f"Already translated, skipping {input_json}")
+                continue
+            transcripts.append((input_json, *transcript))
+
+        pending = [(text, language) for _, _, language, text in transcripts if text is not None and language != 'en']
+        try:
+            translations = iter(translate_many(pending))
+        except Exception as e:
+            # one bad transcript must not cost the whole batch: retry file by file, a file that fails again gets None
+            # and is not written
+            print(f"Error during batched translation, retrying file by file: {e}")
+            translations = iter([translate_to_english(text, language) for text, language in pending])
+
+        for input_json, data, language, full_text in transcripts:
+            translated_text = next(translations) if full_text is not None and language != 'en' else None
+            try:
+                if write_translation(input_json, data, language, full_text, translated_text):
+                    written.append(input_json)
+            except Exception as e:
+                print(f"Error processing {input_json}: {e}")
+    return written
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="Translate again every transcript, not only new or outdated ones")
+    parser.add_argument("--quantized", action="store_true", help="Use the dynamic int8 model for faster CPU inference")
+    args = parser.parse_args()
+    global QUANTIZED
+    QUANTIZED = QUANTIZED or args.quantized
+
     for directory in [INPUT_DIR, OUTPUT_DIR, TEMP_DIR]:
         if not os.path.exists(directory):
             os.makedirs(directory)
             print(f"Folder created: {directory}")
 
-    for filename in os.listdir(OUTPUT_DIR):
-        if filename.endswith('.json'):
-            input_json = os.path.join(OUTPUT_DIR, filename)
-            process_json_file(input_json)
+    manifest = Manifest()
+    if args.force:
+        manifest.force("translate")
+    clip_ids = [filename[:-len('.json')] for filename in sorted(os.listdir(OUTPUT_DIR)) if filename.endswith('.json')]
+    input_jsons = [os.path.join(OUTPUT_DIR, f"{clip_id}.json") for clip_id in manifest.pending(clip_ids, "translate", STAGE_VERSION)]
+    print(f"{len(input_jsons)} of {len(clip_ids)} transcripts to translate")
+
+    # the manifest already decided what is outdated, including transcripts translated by an older version
+    # only what was written this run is recorded: a failed retranslation leaves its clip pending, even over an old text
+    for input_json in translate_files(input_jsons, force=True):
+        manifest.record(os.path.basename(input_json)[:-len('.json')], "translate", STAGE_VERSION, input_json)
+    manifest.close()
+    print(get_cache().stats())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
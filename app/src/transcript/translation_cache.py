@@ -0,0 +1,82 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+class TranslationCache:
+    # sentence translations keyed by sha256(source language, model id, model path, quantized, normalized text),
+    # evicted least recently used first. fp32 and int8 output can differ, so the two modes never share entries
+
+    def __init__(self, path, model_id, model_path, quantized=False, max_entries=200_000):
+        self.path = path
+        self.model_id = model_id
+        self.model_path = model_path
+        self.quantized = quantized
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, translation TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+
+    def key(self, src_lang, text):
+        model = f"{self.model_id}\0{self.model_path}\0{'int8' if self.quantized else 'fp32'}"
+        return hashlib.sha256(f"{src_lang}\0{model}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def get_many(self, src_lang, texts):
+        # returns {index: translation} for the texts already cached
+        keys = [self.key(src_lang, text) for text in texts]
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, translation FROM translations WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                with self.conn:
+                    self.conn.executemany("UPDATE translations SET last_used = ? WHERE key = ?",
+                                          [(time.time(), key) for key in found])
+            result = {i: found[key] for i, key in enumerate(keys) if key in found}
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+        return result
+
+    def put_many(self, src_lang, pairs):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO translations (key, translation, last_used) VALUES (?, ?, ?)",
+                [(self.key(src_lang, text), translation, now) for text, translation in pairs]
+            )
+            self._evict()
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM translations WHERE key IN (SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        return f"translation cache: {self.hits} hits, {self.misses} misses ({ratio:.0%} hit ratio)"
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,12 +1,13 @@
 import csv
 import json
 import os
-from groq import Groq
+from src.transcript.llm_client import get_llm_client
+from src.client_profiles import get_profile_store
+from src.wrong_info.structured_check import check_structured
 import traceback
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 results_path = os.path.join(BASE_DIR, 'wrong_info', 'wrong_info_results.csv')
-print(results_path)
 matched_results_path = os.path.join(BASE_DIR, 'impersonator', 'filtered_matched_results.csv')
 
 
@@ -27,13 +28,12 @@ def get_name_by_id(transcript_id):
     return transcript_data.get(transcript_id, '')
 
 def get_row_data(client_data_file, full_name):
+    # the store parses the client book once per process and looks names up in its normalized-name index
     try:
-        with open(client_data_file, 'r', encoding='utf-8') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                if row['name'].lower().strip() == full_name.lower().strip():
-                    return row
-            print(f"No match found for {full_name}")
+        row = get_profile_store(client_data_file).by_name(full_name)
+        if row is not None:
+            return row
+        print(f"No match found for {full_name}")
     except FileNotFoundError:
         print(f"Error: {client_data_file} not found.")
     except Exception as e:
@@ -56,7 +56,8 @@ def load_transcript(transcript_id):
         print(traceback.format_exc())
     return None
 
-def check_facts(transcript_id, client_data_file, client):
+def check_facts(transcript_id, client_data_file, get_client=get_llm_client):
+    # get_client returns the shared LLM client, it is only called for the fields or transcripts the context cannot settle
     try:
         full_name = get_name_by_id(transcript_id)
         if not full_name:
@@ -73,9 +74,15 @@ def check_facts(transcript_id, client_data_file, client):
             print(f"Warning: Failed to load transcript for ID: {transcript_id}")
             return None, None
 
+        # the context extracted by catch_context.py settles most checks field by field, without a network round trip;
+        # the whole transcript goes to the LLM only when there is nothing structured to compare
+        structured_result = check_structured(transcript.get('context'), row_data, get_client)
+        if structured_result is not None:
+            return full_name, structured_result
+
         data_string = ", ".join([f"{k}: {v}" for k, v in row_data.items()])
         try:
-            analysis = client.chat.completions.create(
+            analysis = get_client().chat_sync(
                 messages=[
                     {
                         "role": "system",
@@ -94,7 +101,7 @@ def check_facts(transcript_id, client_data_file, client):
                 ],
                 model="llama3-8b-8192",
             )
-            output_line = analysis.choices[0].message.content.split('\n')[-1]
+            output_line = analysis.split('\n')[-1]
             result_str = output_line.split(': ')[-1].lower().strip()
             if (result_str == "output=true" or result_str == "true"):
                 result = True
@@ -127,9 +134,7 @@ def write_result(transcript_id, result):
         writer.writerow([transcript_id, 'TRUE' if result else 'FALSE'])
 
 def process_transcript(client_data_file, transcript_id):
-    client = Groq(api_key="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")
-    
-    full_name, result = check_facts(transcript_id, client_data_file, client)
+    full_name, result = check_facts(transcript_id, client_data_file)
     
     if full_name and result is not None:
         write_result(transcript_id, result)
@@ -144,7 +149,8 @@ def run_fact_check(client_data_file, transcript_id):
     return process_transcript(client_data_file, transcript_id)
 
 # Usage
-client_data_file = os.path.join(BASE_DIR, "client_profiles", "client_features.csv")
-transcript_id = "your_transcript_id_here"  # Replace with actual transcript ID
-result = run_fact_check(client_data_file, transcript_id)
-print(f"Fact check result for {transcript_id}: {'Passed' if result else 'Failed'}")
+if __name__ == "__main__":
+    client_data_file = os.path.join(BASE_DIR, "client_profiles", "client_features.csv")
+    transcript_id = "your_transcript_id_here"  # Replace with actual transcript ID
+    result = run_fact_check(client_data_file, transcript_id)
+    print(f"Fact check result for {transcript_id}: {'Passed' if result else 'Failed'}")
@@ -1,8 +1,14 @@
 import csv
 import json
 import os
-from groq import Groq
+import functools
+from src.transcript import llm_client
+from src.transcript.llm_client import get_llm_client
+from src.client_profiles import get_profile_store
+from src.wrong_info.structured_check import check_structured
 import traceback
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -28,13 +34,12 @@ def get_name_by_id(transcript_id):
     return transcript_data.get(transcript_id, '')
 
 def get_row_data(client_data_file, full_name):
+    # the store parses the client book once per process and looks names up in its normalized-name index
     try:
-        with open(client_data_file, 'r', encoding='utf-8') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                if row['name'].lower().strip() == full_name.lower().strip():
-                    return row
-            print(f"No match found for {full_name}")
+        row = get_profile_store(client_data_file).by_name(full_name)
+        if row is not None:
+            return row
+        print(f"No match found for {full_name}")
     except FileNotFoundError:
         print(f"Error: {client_data_file} not found.")
     except Exception as e:
@@ -57,7 +62,8 @@ def load_transcript(transcript_id):
         print(traceback.format_exc())
     return None
 
-def check_facts(transcript_id, client_data_file, client):
+def check_facts(transcript_id, client_data_file, get_client=get_llm_client):
+    # get_client returns the shared LLM client, it is only called for the fields or transcripts the context cannot settle
     try:
         # Step 1: Get name by id from matched_results.csv
         full_name = get_name_by_id(transcript_id)
@@ -77,10 +83,16 @@ def check_facts(transcript_id, client_data_file, client):
             print(f"Warning: Failed to load transcript for ID: {transcript_id}")
             return None, None
 
+        # the context extracted by catch_context.py settles most checks field by field, without a network round trip;
+        # the whole transcript goes to the LLM only when there is nothing structured to compare
+        structured_result = check_structured(transcript.get('context'), row_data, get_client)
+        if structured_result is not None:
+            return full_name, structured_result
+
         # Step 4: Run the analysis
         data_string = ", ".join([f"{k}: {v}" for k, v in row_data.items()])
         try:
-            analysis = client.chat.completions.create(
+            analysis = get_client().chat_sync(
                 messages=[
                     {
                         "role": "system",
@@ -99,7 +111,7 @@ def check_facts(transcript_id, client_data_file, client):
                 ],
                 model="llama3-8b-8192",
             )
-            output_line = analysis.choices[0].message.content.split('\n')[-1]
+            output_line = analysis.split('\n')[-1]
             result_str = output_line.split(': ')[-1].lower().strip()
             if (result_str == "output=true" or result_str == "true"):
                 result = True
@@ -116,46 +128,71 @@ def check_facts(transcript_id, client_data_file, client):
         print(traceback.format_exc())
         return None, None
 
-def process_all_transcripts(client_data_file, single_transcript_id=None):
-    client = Groq(api_key="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")
-    results = []
+def load_results(path):
+    # rec_id -> result already written by an earlier, possibly interrupted, run; later rows win
+    done = {}
+    if not os.path.isfile(path):
+        return done
+    with open(path, 'r', newline='') as csvfile:
+        for row in csv.reader(csvfile):
+            if len(row) == 2 and row[0] != 'rec_id':
+                done[row[0]] = row[1].strip().upper() == 'TRUE'
+    return done
+
+def process_all_transcripts(client_data_file, single_transcript_id=None, workers=16, resume=True, concurrency=None):
+    # every transcript is checked on a thread pool sharing one LLM client, which still enforces the in-flight and rate
+    # limits (concurrency, else GROQ_CONCURRENCY, and GROQ_RPM, GROQ_TPM). Results are appended to results_path as
+    # they finish, so an interrupted run picks up where it stopped. The client is only created once a check needs it
+    get_client = functools.partial(get_llm_client, concurrency)
 
     if single_transcript_id:
-        full_name, result = check_facts(single_transcript_id, client_data_file, client)
-        if full_name and result is not None:
-            results.append([single_transcript_id, result])
+        transcript_ids = [single_transcript_id]
+        done = {}
     else:
-        transcript_ids = []
-        matched_results_path = os.path.join(BASE_DIR, 'impersonator', 'filtered_matched_results.csv')
-        with open(matched_results_path, 'r') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                transcript_ids.append(row[0])
-
-        for transcript_id in transcript_ids:
-            full_name, result = check_facts(transcript_id, client_data_file, client)
-            if full_name and result is not None:
-                results.append([transcript_id, result])
-
-    with open(results_path, 'w', newline='') as csvfile:
+        transcript_ids = [transcript_id for transcript_id in transcript_data if transcript_id != 'rec_id']
+        done = load_results(results_path) if resume else {}
+    pending = [transcript_id for transcript_id in transcript_ids if transcript_id not in done]
+    print(f"{len(pending)} transcripts to check, {len(transcript_ids) - len(pending)} already in {results_path}")
+
+    write_header = not (resume and os.path.isfile(results_path))
+    results = [[transcript_id, done[transcript_id]] for transcript_id in transcript_ids if transcript_id in done]
+    with open(results_path, 'a' if not write_header else 'w', newline='') as csvfile, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
         writer = csv.writer(csvfile)
-        writer.writerow(['rec_id', 'result'])
-        for rec_id, check_result in results:
-            writer.writerow([rec_id, 'TRUE' if check_result else 'FALSE'])
+        if write_header:
+            writer.writerow(['rec_id', 'result'])
+        futures = {executor.submit(check_facts, transcript_id, client_data_file, get_client): transcript_id
+                   for transcript_id in pending}
+        for future in as_completed(futures):
+            full_name, result = future.result()
+            if full_name and result is not None:
+                results.append([futures[future], result])
+                writer.writerow([futures[future], 'TRUE' if result else 'FALSE'])
+                csvfile.flush()
 
     print(f"Results have been written to {results_path}")
+    if llm_client.llm_client is not None:
+        print(llm_client.llm_client.stats())
     return results
     
-def run_fact_check(client_data_file, single_transcript_id=None):
+def run_fact_check(client_data_file, single_transcript_id=None, workers=16, resume=True, concurrency=None):
     load_transcript_data()
-    results = process_all_transcripts(client_data_file, single_transcript_id)
+    results = process_all_transcripts(client_data_file, single_transcript_id, workers=workers, resume=resume,
+                                      concurrency=concurrency)
     
     all_passed = all(result[1] for result in results)
     # check if all true
     
     return not all_passed
 
-# load_transcript_data()
-
-# client_data_file = os.path.join(BASE_DIR, "client_profiles", "client_features.csv")
-# process_all_transcripts(client_data_file)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fact check every matched transcript against the client book")
+    parser.add_argument("--workers", type=int, default=16, help="Transcripts checked at once, and Groq requests in flight")
+    parser.add_argument("--restart", action="store_true", help=f"Ignore the results already in {os.path.basename(results_path)}")
+    parser.add_argument("--transcript-id", default=None, help="Check a single transcript")
+    args = parser.parse_args()
+
+    client_data_file = os.path.join(BASE_DIR, "..", "..", "client_profiles", "client_features.csv")
+    # the client is sized from --workers too, otherwise GROQ_CONCURRENCY would cap the requests in flight below it
+    run_fact_check(client_data_file, args.transcript_id, workers=args.workers, resume=not args.restart,
+                   concurrency=args.workers)
\ No newline at end of file
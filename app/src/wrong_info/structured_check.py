@@ -0,0 +1,209 @@
+import re
+import unicodedata
+from datetime import datetime
+
+# context fields extracted by catch_context.py, and the client book column each one is checked against
+CONTEXT_COLUMNS = {
+    "Name": "name",
+    "birthday": "birthday",
+    "marital_status": "marital_status",
+    "account_nr": "account_nr",
+    "tax_residency": "tax_residency",
+    "net_worth_in_millions": "net_worth_in_millions",
+    "profession": "profession",
+    "social_security_number": "social_security_number",
+    "relationship_manager": "relationship_manager",
+}
+
+LLM_MODEL = "llama3-8b-8192"
+
+DATE_FORMATS = ("%d of %B %Y", "%d %B %Y", "%B %d %Y", "%d %b %Y", "%d %b. %Y", "%b %d %Y", "%b. %d %Y",
+                "%d.%m.%Y", "%Y-%m-%d", "%d-%m-%Y")
+# day and month order is ambiguous in these, so both readings are kept
+AMBIGUOUS_DATE_FORMATS = ("%d/%m/%Y", "%m/%d/%Y")
+ORDINAL_SUFFIX = re.compile(r'(?<=\d)(st|nd|rd|th)\b', re.IGNORECASE)
+
+AMOUNT = re.compile(r"(\d[\d,.' ]*)\s*(billion|bn|mrd|milliard|million|mio|mn|m|thousand|k|b)?\b", re.IGNORECASE)
+AMOUNT_SCALES = {"billion": 1000, "bn": 1000, "mrd": 1000, "milliard": 1000, "b": 1000,
+                 "million": 1, "mio": 1, "mn": 1, "m": 1, "thousand": 0.001, "k": 0.001}
+
+DIGIT_WORDS = {"zero": "0", "oh": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+               "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9"}
+DIGIT_WORD = re.compile(r"\b(" + "|".join(DIGIT_WORDS) + r")\b")
+# a digit run, optionally led by a letter prefix ("ZR1023", "ZR-1023"), with its groups split by spaces, dots or dashes
+CODE = re.compile(r"\b(?:[a-z]+[-./]?)?\d[a-z\d]*(?:[-./\s]+\d[a-z\d]*)*\b")
+
+MARITAL_STATUSES = {"single": "single", "unmarried": "single", "married": "married", "divorced": "divorced",
+                    "widowed": "widowed", "widow": "widowed", "widower": "widowed", "separated": "separated"}
+
+COUNTRY_ALIASES = {"usa": "united states", "us": "united states", "united states of america": "united states",
+                   "america": "united states", "uk": "united kingdom", "great britain": "united kingdom",
+                   "britain": "united kingdom", "england": "united kingdom", "uae": "united arab emirates",
+                   "holland": "netherlands", "the netherlands": "netherlands",
+                   "swiss": "switzerland"}
+
+
+def normalize_text(value):
+    value = ''.join(c for c in unicodedata.normalize('NFD', str(value).casefold()) if unicodedata.category(c) != 'Mn')
+    return ' '.join(re.sub(r"[^\w\s]", ' ', value).split())
+
+
+def parse_dates(value):
+    # every date the value can be read as; empty when it is not a date
+    text = ' '.join(ORDINAL_SUFFIX.sub('', str(value)).replace(',', ' ').split())
+    for date_format in DATE_FORMATS:
+        try:
+            return {datetime.strptime(text, date_format).date()}
+        except ValueError:
+            continue
+    dates = set()
+    for date_format in AMBIGUOUS_DATE_FORMATS:
+        try:
+            dates.add(datetime.strptime(text, date_format).date())
+        except ValueError:
+            continue
+    return dates
+
+
+def parse_millions(value):
+    # amount in millions: "$250 Mio.", "250 million", "USD 250,000,000" and a bare "250" (the field is in millions)
+    match = AMOUNT.search(str(value).replace('’', "'"))
+    if match is None:
+        return None
+    number, scale = match.group(1).strip(), match.group(2)
+    number = re.sub(r"[' ]", '', number)
+    if re.fullmatch(r"\d{1,3}(,\d{3})+(\.\d+)?", number):
+        number = number.replace(',', '')
+    elif re.fullmatch(r"\d{1,3}(\.\d{3})+(,\d+)?", number):
+        number = number.replace('.', '').replace(',', '.')
+    else:
+        number = number.replace(',', '.')
+    try:
+        amount = float(number)
+    except ValueError:
+        return None
+    if scale:
+        return amount * AMOUNT_SCALES[scale.lower()]
+    return amount / 1e6 if amount >= 100_000 else amount
+
+
+def normalize_code(value):
+    # account and social security numbers: spoken digits become digits, separators and case are dropped.
+    # None unless the value holds exactly one code, so "account ZR1023" reads as ZR1023 and anything else is for the LLM
+    text = DIGIT_WORD.sub(lambda match: DIGIT_WORDS[match.group(1)], str(value).casefold())
+    codes = CODE.findall(text)
+    if len(codes) != 1:
+        return None
+    return re.sub(r"[-./\s]", '', codes[0]).upper()
+
+
+def compare_date(stated, recorded):
+    stated_dates, recorded_dates = parse_dates(stated), parse_dates(recorded)
+    if not stated_dates or not recorded_dates:
+        return None
+    return bool(stated_dates & recorded_dates)
+
+
+def compare_amount(stated, recorded, tolerance=0.005):
+    stated_amount, recorded_amount = parse_millions(stated), parse_millions(recorded)
+    if stated_amount is None or recorded_amount is None:
+        return None
+    return abs(stated_amount - recorded_amount) <= max(tolerance * abs(recorded_amount), 0.01)
+
+
+def compare_code(stated, recorded):
+    stated_code, recorded_code = normalize_code(stated), normalize_code(recorded)
+    if not stated_code or not recorded_code:
+        return None
+    if stated_code == recorded_code:
+        return True
+    # a prefix spelled out letter by letter ("Z R one zero...") is not part of the code, the digits alone cannot tell
+    if stated_code.isdigit() != recorded_code.isdigit() and re.sub(r"\D", '', stated_code) == re.sub(r"\D", '', recorded_code):
+        return None
+    return False
+
+
+def compare_marital_status(stated, recorded):
+    stated_status = MARITAL_STATUSES.get(normalize_text(stated))
+    recorded_status = MARITAL_STATUSES.get(normalize_text(recorded))
+    if stated_status is None or recorded_status is None:
+        return None
+    return stated_status == recorded_status
+
+
+def compare_country(stated, recorded):
+    stated_country, recorded_country = normalize_text(stated), normalize_text(recorded)
+    stated_country = COUNTRY_ALIASES.get(stated_country, stated_country)
+    recorded_country = COUNTRY_ALIASES.get(recorded_country, recorded_country)
+    return True if stated_country == recorded_country else None
+
+
+def compare_text(stated, recorded):
+    # free text only resolves when equal after normalization, anything else is for the LLM to judge
+    return True if normalize_text(stated) == normalize_text(recorded) else None
+
+
+COMPARATORS = {
+    "name": compare_text,
+    "birthday": compare_date,
+    "marital_status": compare_marital_status,
+    "account_nr": compare_code,
+    "tax_residency": compare_country,
+    "net_worth_in_millions": compare_amount,
+    "profession": compare_text,
+    "social_security_number": compare_code,
+    "relationship_manager": compare_text,
+}
+
+
+def compare_context(context, row):
+    # per column: True or False when decided locally, None when the comparators cannot tell
+    verdicts = {}
+    for field, column in CONTEXT_COLUMNS.items():
+        stated, recorded = context.get(field), row.get(column)
+        if stated in (None, "") or recorded in (None, ""):
+            continue
+        verdicts[column] = COMPARATORS[column](stated, recorded)
+    return verdicts
+
+
+def ask_llm(fields, context, row, get_client):
+    statements = "\n".join(
+        f"{column}: caller said '{context[field]}', client data says '{row[column]}'"
+        for field, column in CONTEXT_COLUMNS.items() if column in fields
+    )
+    analysis = get_client().chat_sync(
+        messages=[
+            {
+                "role": "system",
+                "content": "For each field, decide whether what the caller said MATCHES or DOES NOT MATCH the client data. "
+                "Allow for different wording, spelling and formatting of the same fact.\n"
+                "Conclude with 'output=true' if ALL fields match, or 'output=false' if ANY field does not match, on the last line."
+            },
+            {
+                "role": "user",
+                "content": statements
+            }
+        ],
+        model=LLM_MODEL,
+        temperature=0,
+    )
+    result_str = analysis.split('\n')[-1].split(': ')[-1].lower().strip()
+    return result_str in ("output=true", "true")
+
+
+def check_structured(context, row, get_client):
+    # True or False when the extracted context decides the check, None when it holds nothing comparable.
+    # A locally detected mismatch fails the check at once; the LLM only sees the fields the comparators left open,
+    # and get_client is only called then, so a check settled locally needs no API key
+    if not context:
+        return None
+    verdicts = compare_context(context, row)
+    if not verdicts:
+        return None
+    if any(verdict is False for verdict in verdicts.values()):
+        return False
+    unresolved = [column for column, verdict in verdicts.items() if verdict is None]
+    if not unresolved:
+        return True
+    return ask_llm(unresolved, context, row, get_client)